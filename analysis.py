@@ -1,28 +1,86 @@
 import os
 import json
+import time
+import uuid
 import base64
-import requests
 from io import BytesIO
-from PIL import Image
-from openai import OpenAI
 from flask import current_app
-from duckduckgo_search import DDGS
+from cache import cache_key, get_cache
+from ocr import confident_label_text, submit_label_read
+from phash import dhash, get_hash_index
+from storage import get_storage
+from prompts import build_analysis_messages, build_system_prompt, trim_snippets
+from resilience import UpstreamHTTPError, call_with_retries, get_breaker, hedged_call
+from singleflight import coalesce, flight_options
+from planner import timed
 
-def perform_web_search(query):
+
+def _call_upstream(provider, stage, fn, deadline=None):
     """
-    Performs a web search using DuckDuckGo and returns the top results.
+    Runs fn(timeout) for one upstream stage with its timeout cap, bounded
+    retries and the provider's circuit breaker, within the scan deadline.
+    """
+    config = current_app.config
+    breaker = get_breaker(provider, config.get('CIRCUIT_FAILURE_THRESHOLD', 5), config.get('CIRCUIT_RESET_SECONDS', 30))
+    # Observed latency feeds the degraded-mode planner
+    with timed(stage):
+        return call_with_retries(
+            fn, breaker,
+            retries=config.get('UPSTREAM_RETRIES', 2),
+            deadline=deadline,
+            stage_cap=config.get('UPSTREAM_TIMEOUTS', {}).get(stage)
+        )
+
+def fetch_search_results(query, max_results=None, deadline=None):
+    """
+    Returns the raw DuckDuckGo results for a query as a list of dicts.
+    Results are kept in the shared cache so every node reuses them, and
+    concurrent identical queries share one request.
+    With SEARCH_API_URL set, queries that JSON endpoint instead (e.g. a
+    self-hosted search proxy or the load-test stub).
     """
+    if max_results is None:
+        max_results = current_app.config.get('SEARCH_MAX_RESULTS', 5)
+    hedge_delay = current_app.config.get('SEARCH_HEDGE_DELAY', 1.5)
+    search_api_url = current_app.config.get('SEARCH_API_URL')
+
+    def query_backend(timeout):
+        if search_api_url:
+            import requests
+            response = requests.get(search_api_url, params={'q': query, 'max_results': max_results},
+                                    timeout=timeout)
+            response.raise_for_status()
+            return list(response.json().get('results', []))[:max_results]
+        from duckduckgo_search import DDGS
+        return list(DDGS(timeout=max(1, int(timeout or 10))).text(query, max_results=max_results) or [])
+
+    def search(timeout):
+        # Search latency is spiky; a duplicate request after hedge_delay cuts the tail
+        return hedged_call(lambda: query_backend(timeout), hedge_delay, timeout)
+
     try:
-        results = DDGS().text(query, max_results=3)
-        search_summary = "\n".join([f"- {r['title']}: {r['body']}" for r in results])
-        return search_summary
+        return coalesce(
+            cache_key('search', max_results, query),
+            lambda: _call_upstream('search', 'search', search, deadline),
+            get_cache(), current_app.config.get('SEARCH_CACHE_TTL'), **flight_options(deadline)
+        )
     except Exception as e:
         current_app.logger.error(f"Web Search Error: {e}")
+        return []
+
+def perform_web_search(query):
+    """
+    Performs a web search using DuckDuckGo and returns the top results.
+    """
+    results = fetch_search_results(query)
+    snippets = trim_snippets(results, current_app.config.get('SEARCH_CONTEXT_TOKEN_BUDGET', 300))
+    if not snippets:
         return "No search results available."
+    return "\n".join(snippets)
 
 def save_temp_image(image_data_base64, filename):
     """
-    Saves base64 image to static/uploads for display.
+    Saves base64 image to uploads/ in blob storage for display.
     """
     try:
         if ',' in image_data_base64:
@@ -30,15 +88,18 @@ def save_temp_image(image_data_base64, filename):
         else:
             encoded = image_data_base64
             
+        from PIL import Image
         image_bytes = base64.b64decode(encoded)
         image = Image.open(BytesIO(image_bytes))
         
-        # Ensure uploads directory exists
-        uploads_dir = os.path.join(current_app.root_path, 'static', 'uploads')
-        os.makedirs(uploads_dir, exist_ok=True)
+        # Re-encode in the format implied by the filename, as saving to a path would
+        image_format = Image.registered_extensions().get(os.path.splitext(filename)[1].lower(), 'JPEG')
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, image_format)
         
-        filepath = os.path.join(uploads_dir, filename)
-        image.save(filepath)
+        get_storage().save(f"uploads/{filename}", buffer.getvalue(), Image.MIME.get(image_format))
         return filename
     except Exception as e:
         current_app.logger.error(f"Image Save Error: {e}")
@@ -46,39 +107,37 @@ def save_temp_image(image_data_base64, filename):
 
 def save_temp_audio(audio_data_base64, filename):
     """
-    Saves base64 audio to static/audio for playback.
+    Saves base64 audio to audio/ in blob storage for playback.
     """
     try:
         audio_bytes = base64.b64decode(audio_data_base64)
-        
-        # Ensure audio directory exists
-        audio_dir = os.path.join(current_app.root_path, 'static', 'audio')
-        os.makedirs(audio_dir, exist_ok=True)
-        
-        filepath = os.path.join(audio_dir, filename)
-        with open(filepath, 'wb') as f:
-            f.write(audio_bytes)
+        get_storage().save(f"audio/{filename}", audio_bytes, _audio_codec()[1])
         return filename
     except Exception as e:
         current_app.logger.error(f"Audio Save Error: {e}")
         return None
 
-def analyze_image_vision(image_data_base64, user_profile):
+_openai_clients = {}
+
+def get_openai_client(api_key, base_url=None):
     """
-    Sends image directly to OpenAI Vision model for analysis.
+    Returns a shared OpenAI client for the given key (and API base URL, if not
+    the default) so its connection pool is reused across scans instead of
+    being rebuilt on every request.
     """
-    # Initialize OpenAI client with the key from config
-    api_key = current_app.config.get('OPENAI_API_KEY')
-    if not api_key:
-        current_app.logger.error("OpenAI API key is missing.")
-        return "Error: OpenAI API key is not configured."
-
-    client = OpenAI(api_key=api_key)
-
-    # Ensure we have the data URL prefix for OpenAI
-    if not image_data_base64.startswith('data:image'):
-        image_data_base64 = f"data:image/jpeg;base64,{image_data_base64}"
+    client = _openai_clients.get((api_key, base_url))
+    if client is None:
+        # Imported on first use; the SDK is the heaviest import in the app
+        from openai import OpenAI
+        # Retries are handled by _call_upstream so they respect the scan deadline
+        client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        _openai_clients[(api_key, base_url)] = client
+    return client
 
+def build_user_context(user_profile):
+    """
+    Formats the user's health profile into the text block used in prompts.
+    """
     # Parse allergies if it's a JSON string
     allergies_data = user_profile.get('allergies', 'None')
     try:
@@ -90,96 +149,280 @@ def analyze_image_vision(image_data_base64, user_profile):
     except Exception:
         pass # Keep original string if parsing fails
 
-    user_context = (
+    return (
         f"User Profile:\n"
         f"Allergies: {allergies_data}\n"
         f"Chronic Conditions: {user_profile.get('chronic_conditions', 'None')}\n"
         f"Dietary Preferences: {user_profile.get('dietary_preferences', 'None')}\n"
         f"Medications: {user_profile.get('medications', 'None')}\n"
     )
-    
-    # Step 1: Identify the product
+
+def _as_data_url(image_data_base64):
+    # Ensure we have the data URL prefix for OpenAI
+    if not image_data_base64.startswith('data:image'):
+        image_data_base64 = f"data:image/jpeg;base64,{image_data_base64}"
+    return image_data_base64
+
+def _record_usage(usage, stage, response):
+    if usage is None:
+        return
+    call = usage.add(stage, response)
+    if call:
+        current_app.logger.info(
+            f"OpenAI usage [{stage}]: prompt={call['prompt_tokens']} "
+            f"cached={call['cached_tokens']} completion={call['completion_tokens']}"
+        )
+
+def identify_product(client, image_data_base64, usage=None, deadline=None):
+    """
+    Step 1: asks the vision model for the product name only.
+    """
     identify_prompt = (
         "Identify the food product in this image. "
         "Return ONLY the product name. If you cannot identify it, return 'Unknown'."
     )
 
+    identification_response = _call_upstream('openai', 'identify', lambda timeout: client.chat.completions.create(
+        model="gpt-4o", 
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": identify_prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": _as_data_url(image_data_base64)
+                        }
+                    }
+                ]
+            }
+        ],
+        max_tokens=50,
+        timeout=timeout
+    ), deadline)
+    _record_usage(usage, 'identify', identification_response)
+    product_name = identification_response.choices[0].message.content.strip()
+    print(f"Identified Product: {product_name}")
+    return product_name
+
+def _is_unknown(product_name):
+    return not product_name or product_name.strip().lower() in ('unknown', 'unknown product')
+
+def resolve_product(client, image_data_base64, usage=None, deadline=None, allow_model=True):
+    """
+    Identifies the product, reusing the identity of an earlier scan whose image
+    is perceptually near-identical (same product, different angle or lighting)
+    instead of calling the model. With allow_model=False only the index is used.
+
+    Returns (product_name, identity), where identity records where the name came
+    from: {'source': 'phash', 'distance': ..., 'confidence': ...}, {'source': 'model'},
+    or {'source': None} if nothing identified it.
+    """
+    index = value = None
+    if current_app.config.get('PHASH_ENABLED', True):
+        try:
+            index = get_hash_index()
+            encoded = image_data_base64.split(',', 1)[1] if ',' in image_data_base64 else image_data_base64
+            value = dhash(base64.b64decode(encoded))
+            match = index.lookup(value)
+            if match:
+                product_name, distance = match
+                return product_name, {'source': 'phash', 'distance': distance,
+                                      'confidence': index.confidence(distance)}
+        except Exception as e:
+            current_app.logger.error(f"Image Hash Error: {e}")
+
+    if not allow_model:
+        return None, {'source': None}
+
+    product_name = identify_product(client, image_data_base64, usage, deadline)
+    if value is not None and not _is_unknown(product_name):
+        index.add(value, product_name)
+    return product_name, {'source': 'model'}
+
+def start_label_read(image_data_base64):
+    """
+    Starts reading the label by OCR on the process pool, to run while the product
+    is identified. Returns a handle for finish_label_read, or None when OCR is
+    disabled, not installed or all OCR workers are busy.
+    """
     try:
-        # First call to identify product
-        identification_response = client.chat.completions.create(
-            model="gpt-4o", 
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": identify_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": image_data_base64
-                            }
+        future = submit_label_read(image_data_base64)
+    except Exception as e:
+        current_app.logger.error(f"OCR Error: {e}")
+        return None
+    return (future, time.monotonic()) if future else None
+
+def finish_label_read(label_read, deadline=None):
+    """
+    Returns the label text of a read started by start_label_read if it is clear
+    enough to analyze without the image, else None. Waits for whatever is left of
+    OCR_TIMEOUT since the read started, so OCR adds little once identify is done.
+    """
+    if label_read is None:
+        return None
+    future, started = label_read
+    timeout = max(0.0, current_app.config.get('OCR_TIMEOUT', 5) - (time.monotonic() - started))
+    if deadline:
+        timeout = min(timeout, deadline.remaining())
+    return confident_label_text(future, timeout)
+
+def identify_products(client, image_data_base64, max_products=10, usage=None, deadline=None):
+    """
+    Lists every distinct food product visible in one image (e.g. a shelf photo).
+    Returns a list of product names, empty if none could be identified.
+    """
+    identify_prompt = (
+        "List every distinct food product visible in this image. "
+        "Return a JSON object with a single key 'products' holding a list of product names. "
+        "Return an empty list if you cannot identify any."
+    )
+
+    response = _call_upstream('openai', 'identify', lambda timeout: client.chat.completions.create(
+        model="gpt-4o", 
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": identify_prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": _as_data_url(image_data_base64)
                         }
-                    ]
-                }
-            ],
-            max_tokens=50
+                    }
+                ]
+            }
+        ],
+        max_tokens=300,
+        response_format={"type": "json_object"},
+        timeout=timeout
+    ), deadline)
+    _record_usage(usage, 'identify_products', response)
+    try:
+        products = json.loads(response.choices[0].message.content).get('products', [])
+    except (json.JSONDecodeError, AttributeError):
+        return []
+    names = [str(p).strip() for p in products if str(p).strip()]
+    return names[:max_products]
+
+def analyze_product(client, image_data_base64, user_context, product_name, usage=None, deadline=None,
+                    search=True, label_text=None):
+    """
+    Steps 2 and 3: web search for the identified product, then the full analysis.
+    Returns the model's JSON text. `search=False` skips the web search.
+    With `label_text` (confident OCR output) the label is sent as text to the
+    cheaper OCR_TEXT_MODEL instead of sending the image to the vision model.
+    """
+    # Step 2: Web Search (if product is identified)
+    snippets = []
+    if search and product_name and product_name.lower() != "unknown":
+        search_query = f"{product_name} ingredients nutrition facts"
+        snippets = trim_snippets(
+            fetch_search_results(search_query, deadline=deadline),
+            current_app.config.get('SEARCH_CONTEXT_TOKEN_BUDGET', 300)
         )
-        product_name = identification_response.choices[0].message.content.strip()
-        print(f"Identified Product: {product_name}")
-
-        # Step 2: Web Search (if product is identified)
-        search_context = ""
-        if product_name and product_name.lower() != "unknown":
-            search_query = f"{product_name} ingredients nutrition facts"
-            search_results = perform_web_search(search_query)
-            search_context = f"\n\nWeb Search Results for '{product_name}':\n{search_results}"
-            print(f"Search Context: {search_context}")
-
-        # Step 3: Final Analysis
-        final_prompt = (
-            f"Analyze this food image and the provided context. "
-            f"1. Confirm the product identity visually. "
-            f"2. Use the web search results to find ingredients and nutritional info if not visible on the pack. "
-            f"3. Combine this with your internal knowledge to provide a complete analysis.\n\n"
-            f"User Profile:\n{user_context}\n"
-            f"{search_context}\n\n"
-            f"Provide a structured JSON response with the following fields:\n"
-            f"- product_name: The name of the product.\n"
-            f"- list_ingredients: A list of ingredients in layman easy to understand English.\n"
-            f"- warnings: A list of strings (health warnings based on user profile).\n"
-            f"- summary: A conversational summary of whether it's healthy and a recommendation (plain text, no markdown).\n"
-            f"- voice_response: A friendly audio summary suitable for the user based on their profile.\n\n"
-            f"Return ONLY the JSON object, no markdown formatting. "
-            f"If you don't recognize the food or cannot extract details, return 'Unknown Product' for product_name."
+        print(f"Search Context: {snippets}")
+
+    # Step 3: Final Analysis. The static instructions lead as the system message
+    # so they form a cacheable prefix; the per-user and per-product parts follow.
+    system_prompt = build_system_prompt(current_app.config.get('OPENAI_SYSTEM_PROMPT'))
+    if label_text:
+        model = current_app.config.get('OCR_TEXT_MODEL') or 'gpt-4o-mini'
+        messages = build_analysis_messages(system_prompt, user_context, product_name, snippets, label_text=label_text)
+    else:
+        model = "gpt-4o"
+        messages = build_analysis_messages(
+            system_prompt, user_context, product_name, snippets, _as_data_url(image_data_base64)
         )
 
-        response = client.chat.completions.create(
-            model="gpt-4o", 
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": final_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": image_data_base64
-                            }
-                        }
-                    ]
-                }
-            ],
+    def analyze():
+        response = _call_upstream('openai', 'analyze', lambda timeout: client.chat.completions.create(
+            model=model, 
+            messages=messages,
             max_tokens=1000,
-            response_format={"type": "json_object"}
-        )
+            response_format={"type": "json_object"},
+            timeout=timeout
+        ), deadline)
+        _record_usage(usage, 'analyze_text' if label_text else 'analyze', response)
         print("OpenAI Response:", response.choices[0].message.content)
-        
         return response.choices[0].message.content
+
+    # Identical requests in flight at the same moment (same image, profile and
+    # context) share one call; only the caller that made it is charged for it.
+    # Across workers the result is handed over through the cache for a short while.
+    share_ttl = current_app.config.get('ANALYSIS_SHARE_TTL', 60)
+    key = cache_key('analysis', model, json.dumps(messages, sort_keys=True))
+    return coalesce(key, analyze, get_cache() if share_ttl else None, share_ttl, **flight_options(deadline))
+
+def parse_analysis(analysis_text):
+    """
+    Parses the model's JSON analysis, falling back to an error payload
+    if the model returned plain text or an error message.
+    """
+    try:
+        return json.loads(analysis_text)
+    except (json.JSONDecodeError, TypeError):
+        return {
+            'product_name': 'Analysis Error',
+            'warnings': [],
+            'summary': analysis_text if analysis_text else "Could not analyze image.",
+            'voice_response': "I'm sorry, I couldn't analyze that image properly."
+        }
+
+def analyze_image_vision(image_data_base64, user_profile, usage=None, deadline=None, plan=None, identity=None):
+    """
+    Sends image directly to OpenAI Vision model for analysis.
+    Token counts for each call are added to `usage` (a prompts.TokenUsage) if given,
+    and every call is bounded by `deadline` (a resilience.Deadline) if given.
+    A planner.ScanPlan may skip the identify call and/or the web search.
+    How the product was identified is written to the `identity` dict if given.
+
+    When Tesseract is available the label is read by OCR alongside identification;
+    if the text is clear, the GPT-4o vision analysis is replaced by a text-only one.
+    The identify call still sends the image, since it runs before the read is done.
+    """
+    # Initialize OpenAI client with the key from config
+    api_key = current_app.config.get('OPENAI_API_KEY')
+    if not api_key:
+        current_app.logger.error("OpenAI API key is missing.")
+        return "Error: OpenAI API key is not configured."
+
+    client = get_openai_client(api_key, current_app.config.get('OPENAI_BASE_URL'))
+    user_context = build_user_context(user_profile)
+
+    try:
+        # OCR runs on the process pool while the product is identified
+        label_read = start_label_read(image_data_base64)
+        product_name, source = resolve_product(client, image_data_base64, usage, deadline,
+                                               allow_model=plan is None or plan.identify)
+        label_text = finish_label_read(label_read, deadline)
+        if identity is not None:
+            identity.update(source, product_name=product_name, label_read=bool(label_text))
+        return analyze_product(client, image_data_base64, user_context, product_name, usage, deadline,
+                               search=plan is None or plan.search, label_text=label_text)
     except Exception as e:
         current_app.logger.error(f"OpenAI Vision Error: {e}")
         return "Sorry, I couldn't analyze the image at this time."
 
-def generate_audio(text):
+# ElevenLabs output codec -> (file extension, content type)
+AUDIO_CODECS = {
+    'mp3': ('mp3', 'audio/mpeg'),
+    'opus': ('ogg', 'audio/ogg'),
+}
+
+def _audio_codec():
+    output_format = current_app.config.get('ELEVEN_LABS_OUTPUT_FORMAT') or 'mp3_44100_128'
+    return AUDIO_CODECS.get(output_format.split('_', 1)[0], AUDIO_CODECS['mp3'])
+
+def audio_extension():
+    """
+    File extension for audio produced with the configured ElevenLabs output format.
+    """
+    return _audio_codec()[0]
+
+def generate_audio(text, deadline=None):
     """
     Generates audio from text using ElevenLabs API.
     Returns base64 encoded audio.
@@ -191,10 +434,12 @@ def generate_audio(text):
         current_app.logger.error("ElevenLabs credentials missing.")
         return None
 
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+    output_format = current_app.config.get('ELEVEN_LABS_OUTPUT_FORMAT') or 'mp3_44100_128'
+    base_url = (current_app.config.get('ELEVEN_LABS_BASE_URL') or 'https://api.elevenlabs.io').rstrip('/')
+    url = f"{base_url}/v1/text-to-speech/{voice_id}?output_format={output_format}"
     
     headers = {
-        "Accept": "audio/mpeg",
+        "Accept": _audio_codec()[1],
         "Content-Type": "application/json",
         "xi-api-key": api_key
     }
@@ -208,8 +453,15 @@ def generate_audio(text):
         }
     }
 
+    def post(timeout):
+        import requests
+        response = requests.post(url, json=data, headers=headers, timeout=timeout)
+        if response.status_code == 429 or response.status_code >= 500:
+            raise UpstreamHTTPError('ElevenLabs', response.status_code, response.text[:200])
+        return response
+
     try:
-        response = requests.post(url, json=data, headers=headers)
+        response = _call_upstream('elevenlabs', 'tts', post, deadline)
         if response.status_code == 200:
             return base64.b64encode(response.content).decode('utf-8')
         else:
@@ -217,4 +469,40 @@ def generate_audio(text):
             return None
     except Exception as e:
         current_app.logger.error(f"ElevenLabs Request Error: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def synthesize_audio(text, deadline=None):
+    """
+    Generates and stores the voice clip for text, returning its filename.
+    Identical text (same voice and format) reuses the clip stored earlier, if
+    this node can still read it, or waits for the one being generated by a
+    concurrent scan.
+    """
+    if not text:
+        return None
+
+    key = cache_key(
+        'tts', current_app.config.get('VOICE_ID'), current_app.config.get('ELEVEN_LABS_OUTPUT_FORMAT'), text
+    )
+
+    def synthesize():
+        audio_base64 = generate_audio(text, deadline)
+        if not audio_base64:
+            return None
+        return save_temp_audio(audio_base64, f"{uuid.uuid4()}.{audio_extension()}")
+
+    try:
+        cache = get_cache()
+        audio_filename = coalesce(key, synthesize, cache, current_app.config.get('TTS_CACHE_TTL'),
+                                  **flight_options(deadline))
+        if audio_filename and not get_storage().exists(f"audio/{audio_filename}"):
+            # Cached by a node whose storage this one cannot read (shared cache, local storage),
+            # or the clip was deleted since; make a new one
+            current_app.logger.info(f"Cached audio {audio_filename} is missing; regenerating")
+            cache.delete(key)
+            audio_filename = coalesce(key, synthesize, cache, current_app.config.get('TTS_CACHE_TTL'),
+                                      **flight_options(deadline))
+        return audio_filename
+    except Exception as e:
+        current_app.logger.error(f"Audio Error: {e}")
+        return None
@@ -1,11 +1,25 @@
-from flask import Blueprint, request, jsonify, session, url_for
+from flask import Blueprint, Response, current_app, request, jsonify, session, stream_with_context, url_for
 from flask_login import login_required, current_user
-from analysis import analyze_image_vision, generate_audio, save_temp_image, save_temp_audio
+from analysis import analyze_image_vision, parse_analysis, save_temp_image, synthesize_audio
+from batch import BatchScan
+from history import queue_audio_backfill, record_scan
+from models import db
+from planner import get_scan_counter, monitor, plan_scan
+from prompts import TokenUsage
+from resilience import Deadline
 import uuid
 import json
 
 api = Blueprint('api', __name__)
 
+def _user_profile():
+    return {
+        'allergies': current_user.allergies,
+        'chronic_conditions': current_user.chronic_conditions,
+        'dietary_preferences': current_user.dietary_preferences,
+        'medications': current_user.medications
+    }
+
 @api.route('/api/upload', methods=['POST'])
 @login_required
 def upload_image():
@@ -24,42 +38,98 @@ def upload_image():
         return jsonify({'error': 'Failed to save image'}), 500
 
     # 2. Prepare user profile
-    user_profile = {
-        'allergies': current_user.allergies,
-        'chronic_conditions': current_user.chronic_conditions,
-        'dietary_preferences': current_user.dietary_preferences,
-        'medications': current_user.medications
-    }
-    
-    # 3. Analyze with OpenAI Vision (GPT-4o)
-    analysis_text = analyze_image_vision(image_data, user_profile)
-
-    try:
-        json_analysis = json.loads(analysis_text)
-    except json.JSONDecodeError:
-        # Fallback if the model returns plain text or an error message
-        json_analysis = {
-            'product_name': 'Analysis Error',
-            'warnings': [],
-            'summary': analysis_text if analysis_text else "Could not analyze image.",
-            'voice_response': "I'm sorry, I couldn't analyze that image properly."
-        }
+    user_profile = _user_profile()
     
-    voice_response = json_analysis.get('voice_response', None)
-    
-    # 4. Generate Audio with ElevenLabs
-    audio_base64 = generate_audio(voice_response)
-    audio_filename = None
-    if audio_base64:
-        audio_filename = f"{uuid.uuid4()}.mp3"
-        save_temp_audio(audio_base64, audio_filename)
+    # Scans in flight are counted across the node's workers for the degraded-mode planner
+    counter = get_scan_counter()
+    with monitor.track(counter):
+        # 3. Analyze with OpenAI Vision (GPT-4o)
+        # One time budget for every upstream call this scan makes, and a plan that
+        # sheds optional stages when the latency SLO is at risk
+        deadline = Deadline(current_app.config.get('SCAN_DEADLINE_SECONDS', 45))
+        plan = plan_scan(current_app.config, counter=counter)
+        if plan.degraded:
+            current_app.logger.info(f"Degraded scan: skipping {', '.join(plan.skipped)} (estimate {plan.estimate}s)")
+        usage = TokenUsage()
+        identity = {}
+        analysis_text = analyze_image_vision(image_data, user_profile, usage, deadline, plan, identity)
+
+        json_analysis = parse_analysis(analysis_text)
+        
+        voice_response = json_analysis.get('voice_response', None)
+        
+        # 4. Generate Audio with ElevenLabs (filled in later if shed)
+        audio_filename = synthesize_audio(voice_response, deadline) if plan.tts else None
+
+    # A near-duplicate image match stands in for a skipped identify call
+    degraded = [stage for stage in plan.skipped if stage != 'identify' or identity.get('source') != 'phash']
     
-    # 5. Store result in session
-    session['last_scan_image'] = saved_filename
-    session['last_scan_text'] = analysis_text
-    session['last_scan_audio_filename'] = audio_filename
+    # 5. Persist the scan; the session only carries its id so any node can render it
+    scan = record_scan(current_user.id, json_analysis, analysis_text, saved_filename, audio_filename,
+                       usage.as_dict(), degraded)
+    db.session.commit()
+
+    if not plan.tts:
+        queue_audio_backfill(current_app._get_current_object(), scan.id, voice_response)
+
+    session['last_scan_id'] = scan.id
     
     return jsonify({
         'success': True,
+        'degraded': degraded,
+        'identity': identity,
         'redirect_url': url_for('main.breakdown')
     })
+
+@api.route('/api/upload/batch', methods=['POST'])
+@login_required
+def upload_batch():
+    """
+    Scans several products in one request.
+
+    Accepts {"images": [...]} or a single image with {"multi_product": true} to
+    analyze every product visible in it. Results are streamed back as
+    newline-delimited JSON, one line per item as soon as it completes.
+    """
+    data = request.get_json(silent=True)
+    images = data.get('images') if isinstance(data, dict) else None
+
+    if not images or not isinstance(images, list) or not all(isinstance(i, str) and i for i in images):
+        return jsonify({'error': 'No image data provided'}), 400
+
+    max_items = current_app.config.get('BATCH_MAX_ITEMS', 10)
+    if len(images) > max_items:
+        return jsonify({'error': f'A batch can contain at most {max_items} images'}), 400
+
+    if not current_app.config.get('OPENAI_API_KEY'):
+        return jsonify({'error': 'OpenAI API key is not configured.'}), 503
+
+    app = current_app._get_current_object()
+    user_id = current_user.id
+    scan = BatchScan(app, _user_profile(), app.config.get('BATCH_MAX_WORKERS', 4))
+
+    product_names = None
+    if data.get('multi_product') and len(images) == 1:
+        try:
+            product_names = scan.identify_products(images[0])
+        except Exception as e:
+            current_app.logger.error(f"OpenAI Vision Error: {e}")
+            return jsonify({'error': "Sorry, I couldn't analyze the image at this time."}), 502
+        if not product_names:
+            return jsonify({'error': 'No products could be identified in the image'}), 422
+        images = images * len(product_names)
+
+    def generate():
+        for item in scan.run(images, product_names):
+            analysis_text = item.pop('analysis_text', None)
+            if 'error' not in item:
+                saved = record_scan(user_id, item['analysis'], analysis_text,
+                                    item['image_filename'], item['audio_filename'], item.get('usage'),
+                                    item.get('degraded'))
+                db.session.commit()
+                item['scan_id'] = saved.id
+                if 'tts' in item.get('degraded', []):
+                    queue_audio_backfill(app, saved.id, item['analysis'].get('voice_response'))
+            yield json.dumps(item) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
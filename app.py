@@ -1,16 +1,14 @@
 from flask import Flask, render_template, request, flash, redirect, url_for, session
 from flask_login import LoginManager, login_required, current_user
-from flask_migrate import Migrate
 from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
-from models import db, User
+from models import db, User, Scan, ScanStats
+from history import audio_pending as scan_audio_pending
 import json
-from werkzeug.utils import secure_filename
-import os
-import uuid
+import click
+from avatars import avatar_url, store_avatar, queue_thumbnails
+from media import media_url, media_type
 import base64
-from io import BytesIO
-from PIL import Image
 
 def create_app(config_class=Config):
     app = Flask(__name__)
@@ -19,10 +17,28 @@ def create_app(config_class=Config):
 
     # Initialize extensions
     db.init_app(app)
-    migrate = Migrate(app, db)
+
+    # Redis shares cached filenames between nodes, so blobs have to be shared too
+    if (app.config.get('CACHE_BACKEND') or '').lower() == 'redis' and \
+            (app.config.get('STORAGE_BACKEND') or 'local').lower() == 'local':
+        app.logger.warning(
+            "CACHE_BACKEND=redis with STORAGE_BACKEND=local: cached audio made on another node "
+            "is not readable here and will be regenerated. Use STORAGE_BACKEND=s3 for several nodes."
+        )
+
+    # Flask-Migrate pulls in alembic, which only the `flask db` commands need,
+    # so it is only set up when the app is built by the flask CLI and not in
+    # web workers or tests.
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
     login = LoginManager(app)
     login.login_view = 'auth.login'
 
+    app.jinja_env.globals['avatar_url'] = avatar_url
+    app.jinja_env.globals['media_url'] = media_url
+    app.jinja_env.globals['media_type'] = media_type
+
     @login.user_loader
     def load_user(id):
         return db.session.get(User, int(id))
@@ -37,6 +53,12 @@ def create_app(config_class=Config):
     from api import api as api_bp
     app.register_blueprint(api_bp)
 
+    from history import history as history_bp
+    app.register_blueprint(history_bp)
+
+    from media import media as media_bp
+    app.register_blueprint(media_bp)
+
     # Main Blueprint for core routes
     from flask import Blueprint
     main = Blueprint('main', __name__)
@@ -50,7 +72,9 @@ def create_app(config_class=Config):
     @main.route('/dashboard')
     @login_required
     def dashboard():
-        return render_template('dashboard.html')
+        # Single primary-key lookup; aggregates are maintained on each scan
+        stats = db.session.get(ScanStats, current_user.id)
+        return render_template('dashboard.html', stats=stats)
 
     @main.route('/scan')
     @login_required
@@ -70,12 +94,18 @@ def create_app(config_class=Config):
     @main.route('/breakdown')
     @login_required
     def breakdown():
-        image_filename = session.get('last_scan_image')
-        analysis_text = session.get('last_scan_text')
-        audio_filename = session.get('last_scan_audio_filename')
-
-        if analysis_text is None:
-            analysis_text = '{}'
+        scan_id = request.args.get('scan_id', type=int) or session.get('last_scan_id')
+        if scan_id is None:
+            # Nothing scanned yet in this session
+            return render_template('breakdown.html', image_filename=None, analysis={},
+                                   audio_filename=None, audio_pending=False)
+
+        scan = Scan.query.filter_by(id=scan_id, user_id=current_user.id).first_or_404()
+        image_filename = scan.image_filename
+        analysis_text = scan.analysis_text or '{}'
+        audio_filename = scan.audio_filename
+        # TTS was shed under load and is being generated in the background
+        audio_pending = scan_audio_pending(scan)
         
         try:
             analysis_data = json.loads(analysis_text)
@@ -89,7 +119,8 @@ def create_app(config_class=Config):
         return render_template('breakdown.html', 
                              image_filename=image_filename, 
                              analysis=analysis_data,
-                             audio_filename=audio_filename)
+                             audio_filename=audio_filename,
+                             audio_pending=audio_pending)
 
     @main.route('/profile', methods=['GET', 'POST'])
     @login_required
@@ -104,22 +135,13 @@ def create_app(config_class=Config):
                 current_user.medications = request.form.get('medications')
                 current_user.medical_history = request.form.get('medical_history')
                 
-                # Handle Profile Picture
+                # Handle Profile Picture: store the validated original now,
+                # thumbnails are generated in the background after commit
+                new_avatar = None
                 if 'profile_picture' in request.files:
                     file = request.files['profile_picture']
                     if file and file.filename:
-                        filename = secure_filename(file.filename)
-                        name_without_ext = os.path.splitext(filename)[0]
-                        unique_filename = f"{uuid.uuid4().hex}_{name_without_ext}.webp"
-                        
-                        upload_folder = os.path.join(app.root_path, 'static', 'uploads')
-                        os.makedirs(upload_folder, exist_ok=True)
-                        
-                        image = Image.open(file)
-                        file_path = os.path.join(upload_folder, unique_filename)
-                        image.save(file_path, 'WEBP')
-                        
-                        current_user.profile_picture = unique_filename
+                        new_avatar = store_avatar(file.read())
                 
                 # Handle Base64 Profile Picture (Client-side resized)
                 elif request.form.get('profile_picture_base64'):
@@ -130,19 +152,14 @@ def create_app(config_class=Config):
                         else:
                             encoded = base64_data
                         
-                        image_bytes = base64.b64decode(encoded)
-                        image = Image.open(BytesIO(image_bytes))
-                        
-                        unique_filename = f"{uuid.uuid4().hex}_profile.webp"
-                        upload_folder = os.path.join(app.root_path, 'static', 'uploads')
-                        os.makedirs(upload_folder, exist_ok=True)
-                        
-                        file_path = os.path.join(upload_folder, unique_filename)
-                        image.save(file_path, 'WEBP')
-                        
-                        current_user.profile_picture = unique_filename
+                        new_avatar = store_avatar(base64.b64decode(encoded))
+
+                if new_avatar:
+                    current_user.profile_picture = new_avatar
 
                 db.session.commit()
+                if new_avatar:
+                    queue_thumbnails(app, new_avatar)
                 flash('Profile updated successfully!')
                 return redirect(url_for('main.profile'))
             except Exception as e:
@@ -165,9 +182,56 @@ def create_app(config_class=Config):
 
     app.register_blueprint(main)
 
+    from commands import register_commands
+    register_commands(app)
+
     return app
 
-app = create_app()
+# Heavy SDKs that are otherwise imported lazily on first use. A preloading
+# server imports them once in the master so forked workers share the pages.
+HEAVY_MODULES = (
+    'openai',
+    'duckduckgo_search',
+    'PIL.Image',
+    'requests',
+    'authlib.integrations.flask_client',
+)
+
+def warm_imports():
+    import importlib
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+def after_fork(app):
+    """
+    Drops per-process state inherited from a preloading master: pooled DB
+    connections, HTTP clients and the background thread pool. Then loads
+    the image hash index so the first scan does not pay for it.
+    """
+    import analysis
+    import tasks
+    from phash import get_hash_index
+    with app.app_context():
+        db.engine.dispose()
+    analysis._openai_clients.clear()
+    tasks._executor = None
+    if app.config.get('PHASH_ENABLED', True):
+        get_hash_index(app)
+
+_app = None
+
+def __getattr__(name):
+    # `app` is built on first access (gunicorn `app:app`, `flask` CLI) rather
+    # than at import, so importing this module for create_app() stays cheap.
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000, host='0.0.0.0')
+    create_app().run(debug=True, port=5000, host='0.0.0.0')
@@ -2,35 +2,44 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db, User
 from datetime import datetime
-from authlib.integrations.flask_client import OAuth
+from avatars import DEFAULT_AVATAR, queue_remote_avatar
+import threading
 import uuid
-import requests
-import os
 
 auth = Blueprint('auth', __name__)
-oauth = OAuth()
+
+# Created on first Google login so authlib is not imported at app startup
+oauth = None
+_oauth_lock = threading.Lock()
+
+def _get_oauth(app):
+    global oauth
+    if oauth is None:
+        with _oauth_lock:
+            if oauth is None:
+                from authlib.integrations.flask_client import OAuth
+                registry = OAuth()
+                registry.init_app(app)
+                # Only register Google OAuth if credentials are provided
+                if app.config.get('GOOGLE_CLIENT_ID') and app.config.get('GOOGLE_CLIENT_SECRET'):
+                    registry.register(
+                        name='google',
+                        client_id=app.config['GOOGLE_CLIENT_ID'],
+                        client_secret=app.config['GOOGLE_CLIENT_SECRET'],
+                        server_metadata_url=app.config.get('GOOGLE_DISCOVERY_URL', 'https://accounts.google.com/.well-known/openid-configuration'),
+                        client_kwargs={
+                            'scope': 'openid email profile'
+                        }
+                    )
+                oauth = registry
+    return oauth
 
 def get_google_oauth_client():
     try:
-        return oauth.create_client('google')
+        return _get_oauth(current_app._get_current_object()).create_client('google')
     except Exception:
         return None
 
-@auth.record_once
-def on_load(state):
-    oauth.init_app(state.app)
-    # Only register Google OAuth if credentials are provided
-    if state.app.config.get('GOOGLE_CLIENT_ID') and state.app.config.get('GOOGLE_CLIENT_SECRET'):
-        oauth.register(
-            name='google',
-            client_id=state.app.config['GOOGLE_CLIENT_ID'],
-            client_secret=state.app.config['GOOGLE_CLIENT_SECRET'],
-            server_metadata_url=state.app.config.get('GOOGLE_DISCOVERY_URL', 'https://accounts.google.com/.well-known/openid-configuration'),
-            client_kwargs={
-                'scope': 'openid email profile'
-            }
-        )
-
 @auth.route('/login/google')
 def google_login():
     google = get_google_oauth_client()
@@ -85,25 +94,10 @@ def google_callback():
             db.session.commit()
             flash('Account created successfully via Google!')
 
-        # Download and save profile picture if available and user has default
-        if picture_url and (not user.profile_picture or user.profile_picture == 'default_profile.svg'):
-            try:
-                response = requests.get(picture_url)
-                if response.status_code == 200:
-                    # Generate filename
-                    filename = f"{uuid.uuid4().hex}_google.jpg"
-                    upload_folder = os.path.join(current_app.root_path, 'static', 'uploads')
-                    os.makedirs(upload_folder, exist_ok=True)
-                    
-                    file_path = os.path.join(upload_folder, filename)
-                    with open(file_path, 'wb') as f:
-                        f.write(response.content)
-                        
-                    user.profile_picture = filename
-                    db.session.commit()
-            except Exception as e:
-                # Log error but don't fail login
-                print(f"Failed to download Google profile picture: {e}")
+        # Download the profile picture in the background if the user has the default,
+        # so login never waits on Google's image CDN
+        if picture_url and (not user.profile_picture or user.profile_picture == DEFAULT_AVATAR):
+            queue_remote_avatar(current_app._get_current_object(), user.id, picture_url)
             
         login_user(user)
         user.last_login = datetime.utcnow()
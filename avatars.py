@@ -0,0 +1,141 @@
+import os
+import uuid
+from io import BytesIO
+from flask import current_app, url_for
+from cache import cache_key, get_cache
+from media import media_type, media_url
+from models import db, User
+from resilience import call_with_retries, get_breaker
+from storage import get_storage
+import tasks
+
+DEFAULT_AVATAR = 'default_profile.svg'
+
+# Original formats accepted for upload, mapped to the extension they are stored under
+ALLOWED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+# Refuse decompression bombs before any pixels are decoded
+MAX_PIXELS = 40_000_000
+
+def thumbnail_filename(filename, size, ext='webp'):
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}_{size}.{ext}"
+
+def validate_image(image_bytes):
+    """
+    Checks the upload is a supported, reasonably sized image without decoding it.
+    Returns the file extension to store it under; raises ValueError otherwise.
+    """
+    if not image_bytes:
+        raise ValueError('Empty image.')
+    if len(image_bytes) > current_app.config.get('AVATAR_MAX_BYTES', 5 * 1024 * 1024):
+        raise ValueError('Image is too large.')
+    from PIL import Image
+    try:
+        image = Image.open(BytesIO(image_bytes))
+        image_format = image.format
+        width, height = image.size
+        image.verify()
+    except Exception:
+        raise ValueError('File is not a valid image.')
+    if image_format not in ALLOWED_FORMATS:
+        raise ValueError('Unsupported image format.')
+    if width * height > MAX_PIXELS:
+        raise ValueError('Image dimensions are too large.')
+    return ALLOWED_FORMATS[image_format]
+
+def store_avatar(image_bytes, suffix='profile'):
+    """
+    Validates and stores the original upload as-is, returning its filename.
+    Thumbnails are generated separately by queue_thumbnails().
+    """
+    ext = validate_image(image_bytes)
+    filename = f"{uuid.uuid4().hex}_{suffix}.{ext}"
+    get_storage().save(f"uploads/{filename}", image_bytes, media_type(filename))
+    return filename
+
+def generate_thumbnails(filename):
+    """
+    Writes square WEBP thumbnails of an original avatar for every configured size.
+    """
+    from PIL import Image, ImageOps
+    storage = get_storage()
+    sizes = sorted(current_app.config.get('AVATAR_SIZES', (64, 128, 256)), reverse=True)
+
+    original = storage.read(f"uploads/{filename}")
+    if original is None:
+        current_app.logger.error(f"Avatar Thumbnail Error: {filename} not found")
+        return
+
+    with Image.open(BytesIO(original)) as image:
+        # Let the JPEG decoder downscale while decoding instead of at full resolution
+        image.draft('RGB', (sizes[0] * 2, sizes[0] * 2))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        for size in sizes:
+            thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            name = thumbnail_filename(filename, size)
+            buffer = BytesIO()
+            thumb.save(buffer, 'WEBP', quality=80)
+            storage.save(f"uploads/{name}", buffer.getvalue(), media_type(name))
+            # Each smaller size is derived from the previous one, not the original
+            image = thumb
+
+    # Lets avatar_url() switch to thumbnails without probing storage on every render
+    get_cache().set(cache_key('avatar', filename), True)
+
+def queue_thumbnails(app, filename):
+    return tasks.submit(app, generate_thumbnails, filename)
+
+def fetch_remote_avatar(user_id, picture_url):
+    """
+    Background task: downloads an avatar (e.g. from Google) and sets it on the
+    user if they still have the default picture.
+    """
+    import requests
+    config = current_app.config
+    breaker = get_breaker('avatar', config.get('CIRCUIT_FAILURE_THRESHOLD', 5), config.get('CIRCUIT_RESET_SECONDS', 30))
+    response = call_with_retries(
+        lambda timeout: requests.get(picture_url, timeout=timeout),
+        breaker,
+        retries=config.get('UPSTREAM_RETRIES', 2),
+        stage_cap=config.get('AVATAR_FETCH_TIMEOUT', 10)
+    )
+    if response.status_code != 200:
+        current_app.logger.error(f"Avatar Fetch Error: {response.status_code} for {picture_url}")
+        return None
+
+    filename = store_avatar(response.content, suffix='google')
+    user = db.session.get(User, user_id)
+    if user is None or (user.profile_picture and user.profile_picture != DEFAULT_AVATAR):
+        return None
+    user.profile_picture = filename
+    db.session.commit()
+
+    generate_thumbnails(filename)
+    return filename
+
+def queue_remote_avatar(app, user_id, picture_url):
+    return tasks.submit(app, fetch_remote_avatar, user_id, picture_url)
+
+def avatar_url(user, size=128):
+    """
+    URL of the smallest generated thumbnail at least `size` px wide, falling back
+    to the original while thumbnails are still being generated.
+    """
+    filename = getattr(user, 'profile_picture', None)
+    if not filename or filename == DEFAULT_AVATAR:
+        return url_for('static', filename=DEFAULT_AVATAR)
+
+    sizes = sorted(current_app.config.get('AVATAR_SIZES', (64, 128, 256)))
+    candidates = [s for s in sizes if s >= size] or sizes[-1:]
+    thumb = thumbnail_filename(filename, candidates[0])
+    if get_cache().get(cache_key('avatar', filename)):
+        return media_url('uploads', thumb)
+    # Thumbnails made before the cache was populated (or after it was cleared)
+    storage = get_storage()
+    if storage.local_path(f"uploads/{thumb}") and storage.exists(f"uploads/{thumb}"):
+        return media_url('uploads', thumb)
+    return media_url('uploads', filename)
@@ -0,0 +1,170 @@
+import hashlib
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from analysis import (
+    get_openai_client, build_user_context, resolve_product, identify_products, analyze_product,
+    parse_analysis, start_label_read, finish_label_read, save_temp_image, synthesize_audio
+)
+from planner import get_scan_counter, monitor, plan_scan
+from prompts import TokenUsage
+from resilience import Deadline
+
+
+def _product_key(product_name):
+    """
+    Normalizes a product name so items resolving to the same product share one analysis.
+    """
+    if not product_name or product_name.strip().lower() in ('unknown', 'unknown product'):
+        return None
+    return ' '.join(product_name.lower().split())
+
+
+class BatchScan:
+    """
+    Runs identify -> search -> analyze -> TTS for several images concurrently.
+
+    The user context and OpenAI client are built once and shared by every item.
+    Identical images are only processed once, and items that resolve to the same
+    product reuse the first item's analysis and audio instead of repeating it.
+
+    The whole batch is one request, so its items share one deadline: items still
+    queued when it runs out fail fast instead of outliving the server timeout.
+    """
+
+    def __init__(self, app, user_profile, max_workers=4):
+        self.app = app
+        self.max_workers = max(1, max_workers)
+        self.deadline = Deadline(app.config.get('SCAN_DEADLINE_SECONDS', 45))
+        self.client = get_openai_client(app.config.get('OPENAI_API_KEY'), app.config.get('OPENAI_BASE_URL'))
+        self.user_context = build_user_context(user_profile)
+        self._products = {}
+        self._lock = threading.Lock()
+
+    def identify_products(self, image_data):
+        """
+        Splits a single image showing several products into one item per product.
+        """
+        return identify_products(self.client, image_data, self.app.config.get('BATCH_MAX_ITEMS', 10),
+                                 deadline=self.deadline)
+
+    def _analyze(self, image_data, product_name, deadline=None, plan=None, label_text=None):
+        usage = TokenUsage()
+        search = plan is None or plan.search
+        analysis_text = analyze_product(self.client, image_data, self.user_context, product_name, usage, deadline,
+                                        search=search, label_text=label_text)
+        analysis = parse_analysis(analysis_text)
+
+        audio_filename = None
+        if plan is None or plan.tts:
+            audio_filename = synthesize_audio(analysis.get('voice_response'), deadline)
+
+        return {
+            'analysis': analysis,
+            'analysis_text': analysis_text,
+            'audio_filename': audio_filename,
+            'usage': usage,
+            'degraded': [stage for stage in ('search', 'tts') if plan and stage in plan.skipped]
+        }
+
+    def _analysis_for(self, image_data, product_name, deadline=None, plan=None, label_text=None):
+        """
+        Returns (result, duplicate). The first item to resolve to a product does the
+        work; concurrent items for the same product wait on its future.
+        """
+        key = _product_key(product_name)
+        if key is None:
+            return self._analyze(image_data, product_name, deadline, plan, label_text), False
+
+        with self._lock:
+            future = self._products.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._products[key] = future
+
+        if not leader:
+            return future.result(timeout=deadline.remaining() if deadline else None), True
+
+        try:
+            result = self._analyze(image_data, product_name, deadline, plan, label_text)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result, False
+
+    def _process(self, image_data, image_filename, product_name):
+        counter = get_scan_counter(self.app)
+        with self.app.app_context(), monitor.track(counter):
+            # Each item gets the same load-aware plan as a single scan, within the batch deadline
+            plan = plan_scan(self.app.config, counter=counter)
+            usage = TokenUsage()
+            degraded = []
+            identity = {'source': 'model'}
+            label_text = None
+            if product_name is None:
+                # Items named by multi-product identify share one shelf photo; OCR only helps single labels
+                label_read = start_label_read(image_data)
+                product_name, identity = resolve_product(self.client, image_data, usage, self.deadline,
+                                                         allow_model=plan.identify)
+                label_text = finish_label_read(label_read, self.deadline)
+                if identity['source'] is None and not label_text:
+                    degraded.append('identify')
+            result, duplicate = self._analysis_for(image_data, product_name, self.deadline, plan, label_text)
+            # Only the item that actually ran the analysis is charged for it
+            if not duplicate:
+                usage.merge(result['usage'])
+            return dict(result, image_filename=image_filename, product_name=product_name,
+                        duplicate=duplicate, usage=usage.as_dict(), degraded=result['degraded'] + degraded,
+                        identity=identity)
+
+    def run(self, images, product_names=None):
+        """
+        Yields one result dict per input item, in completion order.
+
+        `images` is a list of base64 images. When `product_names` is given it must have
+        the same length and skips the identify call for each item.
+        """
+        if product_names is None:
+            product_names = [None] * len(images)
+
+        # Identical uploads (same bytes, same product hint) are processed once.
+        groups = {}
+        for index, (image_data, product_name) in enumerate(zip(images, product_names)):
+            digest = hashlib.sha256(f"{product_name}\0{image_data}".encode('utf-8')).hexdigest()
+            groups.setdefault(digest, []).append(index)
+
+        saved = {}
+        unsaved = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for indexes in groups.values():
+                first = indexes[0]
+                image_data = images[first]
+                image_key = hashlib.sha256(image_data.encode('utf-8')).hexdigest()
+                if image_key not in saved:
+                    saved[image_key] = save_temp_image(image_data, f"{uuid.uuid4()}.jpg")
+                if not saved[image_key]:
+                    # Undecodable or unstorable: fail the item as /api/upload does, before any upstream call
+                    unsaved.extend(indexes)
+                    continue
+                future = executor.submit(self._process, image_data, saved[image_key], product_names[first])
+                futures[future] = indexes
+
+            for index in unsaved:
+                yield {'error': 'Failed to save image', 'index': index}
+
+            for future in as_completed(futures):
+                indexes = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.app.logger.error(f"Batch Scan Error: {e}")
+                    result = {'error': "Sorry, I couldn't analyze this item at this time."}
+                for position, index in enumerate(indexes):
+                    item = dict(result, index=index)
+                    if position and 'error' not in result:
+                        item['duplicate'] = True
+                        item['usage'] = TokenUsage().as_dict()
+                    yield item
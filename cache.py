@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app
+
+
+def cache_key(namespace, *parts):
+    """
+    Builds a fixed-length cache key from arbitrary parts, e.g.
+    cache_key('search', query) -> 'search:<sha256>'.
+    """
+    digest = hashlib.sha256('\0'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class NullCache:
+    """
+    Caches nothing. Useful in tests and to rule the cache out when debugging.
+    """
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def add(self, key, value, ttl=None):
+        return True
+
+    def delete(self, key):
+        pass
+
+
+class SQLiteCache:
+    """
+    Key-value cache in a SQLite file. Shared by every worker process on the
+    node, but not across nodes; use RedisCache for that. Values are JSON.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _expires_at(ttl):
+        return time.time() + ttl if ttl else None
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value, expires_at FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] < time.time():
+            self.delete(key)
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), self._expires_at(ttl))
+        )
+
+    def add(self, key, value, ttl=None):
+        """
+        Sets the key only if it is absent (or expired). Returns True if it was set.
+        """
+        conn = self._connect()
+        conn.execute('DELETE FROM cache WHERE key = ? AND expires_at < ?', (key, time.time()))
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), self._expires_at(ttl))
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+
+class RedisCache:
+    """
+    Key-value cache in Redis (or anything speaking its protocol), shared by
+    every node. Requires the redis package unless a client is passed in.
+    """
+
+    def __init__(self, url=None, client=None, prefix='mynutriguide:'):
+        self.prefix = prefix
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+def create_cache(app):
+    backend = (app.config.get('CACHE_BACKEND') or 'sqlite').lower()
+    if backend == 'sqlite':
+        return SQLiteCache(app.config.get('CACHE_SQLITE_PATH') or os.path.join(app.instance_path, 'cache.sqlite'))
+    if backend == 'redis':
+        return RedisCache(app.config.get('REDIS_URL') or 'redis://localhost:6379/0')
+    if backend == 'null':
+        return NullCache()
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+
+
+def get_cache(app=None):
+    """
+    Returns the cache backend configured for the app (built once per app).
+    """
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('cache')
+    if cache is None:
+        cache = app.extensions['cache'] = create_cache(app)
+    return cache
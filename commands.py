@@ -0,0 +1,45 @@
+import subprocess
+import sys
+import click
+
+def parse_importtime(output):
+    """
+    Parses `python -X importtime` stderr into (self_us, cumulative_us, module) tuples.
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            rows.append((int(parts[0]), int(parts[1]), parts[2][1:].rstrip()))
+        except ValueError:
+            continue  # header row
+    return rows
+
+def register_commands(app):
+    @app.cli.command('importtime')
+    @click.option('--module', default='app', show_default=True, help='Module to import.')
+    @click.option('--top', default=25, show_default=True, help='Number of modules to show.')
+    @click.option('--create-app', is_flag=True, help='Also time create_app() after the import.')
+    def importtime(module, top, create_app):
+        """Report the slowest imports (cumulative) for a cold interpreter."""
+        code = f"import {module}"
+        if create_app:
+            code += f"; {module}.create_app()"
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            click.echo(result.stderr, err=True)
+            raise SystemExit(result.returncode)
+
+        rows = parse_importtime(result.stderr)
+        total = sum(self_us for self_us, _, _ in rows)
+        click.echo(f"{'cumulative ms':>14}  {'self ms':>8}  module")
+        for self_us, cumulative_us, name in sorted(rows, key=lambda r: r[1], reverse=True)[:top]:
+            click.echo(f"{cumulative_us / 1000:>14.1f}  {self_us / 1000:>8.1f}  {name}")
+        click.echo(f"\n{len(rows)} modules imported in {total / 1000:.1f} ms")
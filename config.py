@@ -4,6 +4,19 @@ from dotenv import load_dotenv
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env'))
 
+def scan_deadline(server_timeout, headroom, configured=None, default=45, minimum=1):
+    """
+    Seconds a scan may spend on upstream calls: `configured` (or `default`), capped
+    to end `headroom` seconds before the server timeout. A server timeout of 0
+    (gunicorn's "no timeout") sets no cap.
+    """
+    if server_timeout > 0:
+        cap = server_timeout - headroom
+        seconds = min(configured, cap) if configured else cap
+    else:
+        seconds = configured or default
+    return max(minimum, seconds)
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
@@ -11,9 +24,115 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
     ELEVEN_LABS_API_KEY = os.environ.get('ELEVEN_LABS_API_KEY')
+    # Upstream endpoints; override to point at a proxy or the loadtest stubs
+    OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL')
+    ELEVEN_LABS_BASE_URL = os.environ.get('ELEVEN_LABS_BASE_URL') or 'https://api.elevenlabs.io'
+    # JSON search endpoint (?q=&max_results= -> {"results": [{title, href, body}]}); DuckDuckGo if unset
+    SEARCH_API_URL = os.environ.get('SEARCH_API_URL')
     VOICE_ID = os.environ.get('Voice_ID')
+    # Sent as the system message ahead of the static analysis instructions in prompts.py
     OPENAI_SYSTEM_PROMPT = os.environ.get('OPENAI_SYSTEM_PROMPT') or \
-        "You are a helpful nutritionist assistant. Analyze the food label text provided. " \
-        "Return a JSON object with keys: ingredients (list), allergens (list), additives (list), " \
-        "nutritional_concerns (list), recommendation (string), score (integer 0-100), " \
-        "and explanation (string). Consider the user's allergies and conditions if provided."
+        "You are a helpful nutritionist assistant. Analyze the food product provided " \
+        "and consider the user's allergies, conditions, medications and dietary preferences."
+    # Batch scanning: maximum images per request and concurrent items per batch
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS') or 10)
+    BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS') or 4)
+    # Web search: results fetched per product and the token budget for their snippets in the prompt
+    SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS') or 5)
+    SEARCH_CONTEXT_TOKEN_BUDGET = int(os.environ.get('SEARCH_CONTEXT_TOKEN_BUDGET') or 300)
+    # Threads in the background pool (avatar thumbnails, remote fetches)
+    BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS') or 2)
+    # Profile pictures: upload size limit and generated thumbnail sizes (px)
+    AVATAR_MAX_BYTES = int(os.environ.get('AVATAR_MAX_BYTES') or 5 * 1024 * 1024)
+    AVATAR_SIZES = (64, 128, 256)
+    AVATAR_FETCH_TIMEOUT = float(os.environ.get('AVATAR_FETCH_TIMEOUT') or 10)
+    # Media delivery: internal nginx location for X-Accel-Redirect hand-off (e.g. /protected-media,
+    # aliased to static/), or X-Sendfile for Apache/lighttpd. Both unset means Flask sends files itself.
+    MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX')
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+    # ElevenLabs output format; a low-bitrate voice encoding keeps audio small (e.g. opus_48000_32)
+    ELEVEN_LABS_OUTPUT_FORMAT = os.environ.get('ELEVEN_LABS_OUTPUT_FORMAT') or 'mp3_22050_32'
+    # Blob storage for scan images, audio and avatars: 'local' (files under STORAGE_LOCAL_ROOT,
+    # default static/) or 's3' for any S3-compatible object store (requires boto3)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'local'
+    STORAGE_LOCAL_ROOT = os.environ.get('STORAGE_LOCAL_ROOT')
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+    S3_URL_EXPIRES = int(os.environ.get('S3_URL_EXPIRES') or 3600)
+    # Shared cache: 'sqlite' (per node, shared by its workers), 'redis' (shared by all nodes,
+    # requires redis) or 'null'. Cached audio filenames only help other nodes that share the
+    # blob storage too, so run several nodes with redis and STORAGE_BACKEND=s3.
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'sqlite'
+    CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH')
+    REDIS_URL = os.environ.get('REDIS_URL')
+    SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL') or 24 * 3600)
+    TTS_CACHE_TTL = int(os.environ.get('TTS_CACHE_TTL') or 30 * 24 * 3600)
+    # Near-duplicate detection: product names of earlier scans keyed by a 64-bit
+    # perceptual hash; images within PHASH_MAX_DISTANCE bits (0-7, higher values are
+    # capped to keep lookups under a millisecond) reuse the name.
+    # The index file is per node: each node learns from its own scans.
+    PHASH_ENABLED = os.environ.get('PHASH_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    PHASH_MAX_DISTANCE = int(os.environ.get('PHASH_MAX_DISTANCE') or 6)
+    # Plain or blurry photos hash to few set bits and would match each other; hashes with
+    # fewer than PHASH_MIN_BITS set (or unset) always go to the model
+    PHASH_MIN_BITS = int(os.environ.get('PHASH_MIN_BITS') or 12)
+    PHASH_INDEX_PATH = os.environ.get('PHASH_INDEX_PATH')
+    # Label OCR (needs pytesseract and the tesseract binary; skipped if either is missing).
+    # Labels read with at least OCR_MIN_CONFIDENCE (0-100) and OCR_MIN_WORDS are analyzed
+    # as text by OCR_TEXT_MODEL instead of sending the image to GPT-4o. Only that analyze call
+    # is saved: reads run alongside the identify call, which still goes to GPT-4o vision, and
+    # are killed after OCR_TIMEOUT; with all OCR_WORKERS busy a scan skips OCR.
+    OCR_ENABLED = os.environ.get('OCR_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    OCR_WORKERS = int(os.environ.get('OCR_WORKERS') or 2)
+    OCR_LANG = os.environ.get('OCR_LANG') or 'eng'
+    TESSERACT_CMD = os.environ.get('TESSERACT_CMD')
+    OCR_TIMEOUT = float(os.environ.get('OCR_TIMEOUT') or 5)
+    OCR_MIN_CONFIDENCE = float(os.environ.get('OCR_MIN_CONFIDENCE') or 80)
+    OCR_MIN_WORDS = int(os.environ.get('OCR_MIN_WORDS') or 8)
+    OCR_TEXT_MODEL = os.environ.get('OCR_TEXT_MODEL') or 'gpt-4o-mini'
+    # Single-flight: concurrent identical search/analyze/TTS calls share one upstream
+    # request. Other workers wait on a cache lease for up to SINGLE_FLIGHT_WAIT_SECONDS;
+    # analysis results are handed between workers via the cache for ANALYSIS_SHARE_TTL.
+    SINGLE_FLIGHT_LEASE_SECONDS = float(os.environ.get('SINGLE_FLIGHT_LEASE_SECONDS') or 45)
+    SINGLE_FLIGHT_WAIT_SECONDS = float(os.environ.get('SINGLE_FLIGHT_WAIT_SECONDS') or 30)
+    SINGLE_FLIGHT_POLL_INTERVAL = float(os.environ.get('SINGLE_FLIGHT_POLL_INTERVAL') or 0.1)
+    ANALYSIS_SHARE_TTL = int(os.environ.get('ANALYSIS_SHARE_TTL') or 60)
+    # Upstream resilience: one overall budget per scan, a timeout cap per stage, bounded
+    # retries with jittered backoff, and a circuit breaker per provider.
+    # The budget covers OCR, single-flight waits and every upstream call, and has to end
+    # before gunicorn kills the worker (GUNICORN_TIMEOUT, also read by gunicorn.conf.py).
+    # The headroom is left for saving the image and recording the scan; a larger
+    # SCAN_DEADLINE_SECONDS is capped to fit. GUNICORN_TIMEOUT=0 (no timeout) sets no cap.
+    SERVER_TIMEOUT_SECONDS = float(os.environ.get('GUNICORN_TIMEOUT') or 60)
+    SCAN_DEADLINE_HEADROOM_SECONDS = float(os.environ.get('SCAN_DEADLINE_HEADROOM_SECONDS') or 10)
+    SCAN_DEADLINE_SECONDS = scan_deadline(SERVER_TIMEOUT_SECONDS, SCAN_DEADLINE_HEADROOM_SECONDS,
+                                          float(os.environ.get('SCAN_DEADLINE_SECONDS') or 0))
+    UPSTREAM_TIMEOUTS = {
+        'identify': float(os.environ.get('IDENTIFY_TIMEOUT') or 10),
+        'search': float(os.environ.get('SEARCH_TIMEOUT') or 4),
+        'analyze': float(os.environ.get('ANALYZE_TIMEOUT') or 30),
+        'tts': float(os.environ.get('TTS_TIMEOUT') or 10),
+    }
+    UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES') or 2)
+    CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD') or 5)
+    CIRCUIT_RESET_SECONDS = float(os.environ.get('CIRCUIT_RESET_SECONDS') or 30)
+    SEARCH_HEDGE_DELAY = float(os.environ.get('SEARCH_HEDGE_DELAY') or 1.5)
+    # Degraded mode: when the expected scan latency (recent upstream latency scaled by
+    # in-flight scans per SCAN_CONCURRENCY) would exceed the SLO, skip TTS, then web
+    # search, then the separate identify call. Skipped audio is generated in the background.
+    # In-flight scans are counted across all workers on the node in SCAN_COUNTER_PATH;
+    # SCAN_CONCURRENCY is how many the node serves at once (gunicorn workers x threads).
+    DEGRADE_ENABLED = os.environ.get('DEGRADE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    SCAN_LATENCY_SLO_SECONDS = float(os.environ.get('SCAN_LATENCY_SLO_SECONDS') or 20)
+    SCAN_CONCURRENCY = int(os.environ.get('SCAN_CONCURRENCY') or os.environ.get('GUNICORN_WORKERS') or 4)
+    SCAN_COUNTER_PATH = os.environ.get('SCAN_COUNTER_PATH')
+    # Shed audio is retried up to AUDIO_BACKFILL_ATTEMPTS times, first after AUDIO_BACKFILL_DELAY
+    # seconds (at least CIRCUIT_RESET_SECONDS, in case ElevenLabs was failing) and then doubling.
+    # Beyond AUDIO_BACKFILL_MAX_PENDING waiting scans per worker, shed audio is dropped.
+    AUDIO_BACKFILL_ATTEMPTS = int(os.environ.get('AUDIO_BACKFILL_ATTEMPTS') or 3)
+    AUDIO_BACKFILL_DELAY = float(os.environ.get('AUDIO_BACKFILL_DELAY') or 30)
+    AUDIO_BACKFILL_MAX_PENDING = int(os.environ.get('AUDIO_BACKFILL_MAX_PENDING') or 20)
@@ -0,0 +1,24 @@
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS') or 4)
+# Workers silent for longer than this are killed and the client gets a 502. The
+# scan budget (SCAN_DEADLINE_SECONDS in config.py) is derived from the same
+# variable, minus SCAN_DEADLINE_HEADROOM_SECONDS, so a scan always gives up first.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 60)
+accesslog = '-'
+errorlog = '-'
+
+# Build the app once in the master and fork workers from it. Workers then start
+# without re-importing anything and share the imported modules' memory pages.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes')
+
+def when_ready(server):
+    if preload_app:
+        from app import warm_imports
+        warm_imports()
+
+def post_fork(server, worker):
+    if preload_app:
+        import app as app_module
+        app_module.after_fork(app_module.app)
@@ -0,0 +1,230 @@
+import base64
+import threading
+from datetime import datetime, timedelta
+from flask import Blueprint, current_app, render_template, request, jsonify, url_for
+from flask_login import login_required, current_user
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from models import db, Scan, ScanStats
+import tasks
+
+history = Blueprint('history', __name__)
+
+# Keyword buckets used to group free-text warnings on the dashboard
+WARNING_TYPES = [
+    ('allergy', ('allerg', 'gluten', 'peanut', 'nut', 'dairy', 'lactose', 'soy', 'shellfish', 'egg')),
+    ('sugar', ('sugar', 'glucose', 'diabet', 'sweet')),
+    ('sodium', ('sodium', 'salt', 'blood pressure', 'hypertens')),
+    ('fat', ('fat', 'cholesterol')),
+    ('medication', ('medication', 'interact', 'drug')),
+    ('additive', ('additive', 'preservative', 'colour', 'color', 'artificial')),
+]
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Scan.audio_status while background audio is expected, and once it has given up
+AUDIO_PENDING = 'pending'
+AUDIO_UNAVAILABLE = 'unavailable'
+
+_pending_backfills = 0
+_backfill_lock = threading.Lock()
+
+def classify_warning(warning):
+    text = str(warning).lower()
+    for warning_type, keywords in WARNING_TYPES:
+        if any(keyword in text for keyword in keywords):
+            return warning_type
+    return 'other'
+
+def record_scan(user_id, analysis, analysis_text, image_filename=None, audio_filename=None, usage=None,
+                degraded_stages=None):
+    """
+    Persists a scan and folds it into the user's aggregate row.
+    `usage` is a TokenUsage.as_dict() of the OpenAI calls made for the scan and
+    `degraded_stages` the optional stages the planner skipped for it.
+    The caller owns the transaction.
+    """
+    usage = usage or {}
+    warnings = analysis.get('warnings') or []
+    if not isinstance(warnings, list):
+        warnings = [warnings]
+
+    scan = Scan(
+        user_id=user_id,
+        created_at=datetime.utcnow(),
+        product_name=(analysis.get('product_name') or None),
+        image_filename=image_filename,
+        audio_filename=audio_filename,
+        analysis_text=analysis_text,
+        warning_count=len(warnings),
+        prompt_tokens=usage.get('prompt_tokens'),
+        cached_tokens=usage.get('cached_tokens'),
+        completion_tokens=usage.get('completion_tokens'),
+        degraded_stages=','.join(degraded_stages) if degraded_stages else None,
+        audio_status=AUDIO_PENDING if (not audio_filename and 'tts' in (degraded_stages or ())
+                                       and analysis.get('voice_response')) else None
+    )
+    db.session.add(scan)
+
+    # Scans by the same user can be recorded concurrently (two tabs, a batch next to a
+    # single upload), so the aggregate row is locked until the caller commits
+    stats = _locked_stats(user_id)
+    if stats is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(ScanStats(user_id=user_id, total_scans=0, total_warnings=0,
+                                         warnings_by_type='{}', product_counts='{}'))
+        except IntegrityError:
+            # Another scan created the row first
+            pass
+        stats = _locked_stats(user_id)
+    stats.record(scan, [classify_warning(w) for w in warnings])
+    return scan
+
+def _locked_stats(user_id):
+    return db.session.get(ScanStats, user_id, with_for_update=True, populate_existing=True)
+
+def _attach_audio(scan_id, audio_filename):
+    scan = db.session.get(Scan, scan_id)
+    if scan is None:
+        return
+    scan.audio_filename = audio_filename
+    scan.audio_status = None if audio_filename else AUDIO_UNAVAILABLE
+    db.session.commit()
+
+def _release_backfill_slot():
+    global _pending_backfills
+    with _backfill_lock:
+        _pending_backfills -= 1
+
+def backfill_audio(scan_id, text, attempt=1):
+    """
+    Background task: synthesizes the voice response for a scan that skipped
+    TTS under load and attaches it to the scan. A failed attempt (ElevenLabs
+    may be why TTS was shed) is retried after a doubling delay; once
+    AUDIO_BACKFILL_ATTEMPTS have failed the scan is marked as having no audio.
+    """
+    from analysis import synthesize_audio
+    config = current_app.config
+    retry = False
+    try:
+        audio_filename = synthesize_audio(text)
+        retry = not audio_filename and attempt < config.get('AUDIO_BACKFILL_ATTEMPTS', 3)
+        if retry:
+            delay = config.get('AUDIO_BACKFILL_DELAY', 30) * 2 ** attempt
+            tasks.submit_later(current_app._get_current_object(), delay, backfill_audio, scan_id, text, attempt + 1)
+            return None
+        _attach_audio(scan_id, audio_filename)
+        return audio_filename
+    finally:
+        if not retry:
+            _release_backfill_slot()
+
+def queue_audio_backfill(app, scan_id, text):
+    """
+    Schedules audio for a scan that shed TTS, after AUDIO_BACKFILL_DELAY so the
+    load that caused it can pass. At most AUDIO_BACKFILL_MAX_PENDING scans wait
+    per process; beyond that the scan is marked as having no audio right away.
+    """
+    global _pending_backfills
+    if not text:
+        return None
+    with _backfill_lock:
+        queued = _pending_backfills < app.config.get('AUDIO_BACKFILL_MAX_PENDING', 20)
+        if queued:
+            _pending_backfills += 1
+    if not queued:
+        app.logger.info(f"Audio backfill queue full; scan {scan_id} has no audio")
+        _attach_audio(scan_id, None)
+        return None
+    return tasks.submit_later(app, app.config.get('AUDIO_BACKFILL_DELAY', 30), backfill_audio, scan_id, text)
+
+def audio_pending(scan):
+    """
+    Whether background audio may still arrive for a scan. A scan still pending
+    after the whole retry schedule lost its task (e.g. the worker restarted).
+    """
+    if scan.audio_filename or scan.audio_status != AUDIO_PENDING:
+        return False
+    config = current_app.config
+    attempts = config.get('AUDIO_BACKFILL_ATTEMPTS', 3)
+    # The delays between attempts, plus a minute for each attempt itself
+    window = config.get('AUDIO_BACKFILL_DELAY', 30) * (2 ** attempts - 1) + 60 * attempts
+    return datetime.utcnow() - scan.created_at < timedelta(seconds=window)
+
+def encode_cursor(scan):
+    raw = f"{scan.created_at.isoformat()}|{scan.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, scan_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(scan_id)
+    except (ValueError, UnicodeError):
+        return None
+
+def get_scan_page(user_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Returns (scans, next_cursor) for one page of a user's history, newest first.
+    Uses keyset pagination so every page costs the same regardless of depth.
+    """
+    query = Scan.query.filter(Scan.user_id == user_id)
+    if cursor:
+        created_at, scan_id = cursor
+        query = query.filter(or_(
+            Scan.created_at < created_at,
+            and_(Scan.created_at == created_at, Scan.id < scan_id)
+        ))
+    scans = query.order_by(Scan.created_at.desc(), Scan.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(scans) > limit:
+        scans = scans[:limit]
+        next_cursor = encode_cursor(scans[-1])
+    return scans, next_cursor
+
+def _page_args():
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+    return (decode_cursor(cursor) if cursor else None), limit
+
+@history.route('/history')
+@login_required
+def history_page():
+    cursor, limit = _page_args()
+    scans, next_cursor = get_scan_page(current_user.id, cursor, limit)
+    return render_template('history.html', scans=scans, next_cursor=next_cursor)
+
+@history.route('/api/history')
+@login_required
+def history_api():
+    cursor, limit = _page_args()
+    scans, next_cursor = get_scan_page(current_user.id, cursor, limit)
+    return jsonify({
+        'scans': [{
+            'id': scan.id,
+            'created_at': scan.created_at.isoformat(),
+            'product_name': scan.product_name,
+            'warning_count': scan.warning_count,
+            'url': url_for('main.breakdown', scan_id=scan.id)
+        } for scan in scans],
+        'next_cursor': next_cursor
+    })
+
+@history.route('/api/dashboard')
+@login_required
+def dashboard_api():
+    stats = db.session.get(ScanStats, current_user.id)
+    if stats is None:
+        return jsonify({'total_scans': 0, 'total_warnings': 0, 'warnings_by_type': {},
+                        'top_products': [], 'last_scan_at': None})
+    return jsonify({
+        'total_scans': stats.total_scans,
+        'total_warnings': stats.total_warnings,
+        'warnings_by_type': stats.warnings(),
+        'top_products': [{'product_name': name, 'count': count} for name, count in stats.top_products()],
+        'last_scan_at': stats.last_scan_at.isoformat() if stats.last_scan_at else None
+    })
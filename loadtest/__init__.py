@@ -0,0 +1,3 @@
+"""
+Load-test tooling: stub upstream servers (stubs.py) and a scan replay runner (run.py).
+"""
@@ -0,0 +1,244 @@
+"""
+Replays scans against a running app with many virtual users.
+
+Each virtual user registers (or logs in), completes onboarding once, then
+repeatedly uploads a real scan image from static/uploads, opens the breakdown
+page and fetches its audio, like the scan page does. Scans are started at
+--rate per second across all users (0 = as fast as the users can go).
+
+  python -m loadtest.stubs &                       # free upstreams, see stubs.py
+  python -m loadtest.run --url http://127.0.0.1:5000 --users 20 --rate 5 --duration 60
+
+Prints latency percentiles, throughput and error rate per endpoint;
+--json writes the same numbers to a file for comparing runs.
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+
+import requests
+
+ENDPOINTS = ('login', 'upload', 'breakdown', 'audio')
+AUDIO_SRC = re.compile(r'src="([^"]*/media/audio/[^"]+)"')
+IMAGE_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.webp': 'image/webp'}
+# Scans are saved as <uuid4>.jpg; avatars and their thumbnails share the folder
+SCAN_IMAGE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.jpg$')
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of an unsorted list; None if empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Stats:
+    """
+    Thread-safe latency and error samples per endpoint.
+    """
+
+    def __init__(self):
+        self.samples = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = {endpoint: 0 for endpoint in ENDPOINTS}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, elapsed):
+        rows = {}
+        for endpoint, samples in self.samples.items():
+            if not samples:
+                continue
+            rows[endpoint] = {
+                'requests': len(samples),
+                'errors': self.errors.get(endpoint, 0),
+                'error_rate': self.errors.get(endpoint, 0) / len(samples),
+                'throughput': len(samples) / elapsed if elapsed else 0.0,
+                'p50': percentile(samples, 50),
+                'p90': percentile(samples, 90),
+                'p95': percentile(samples, 95),
+                'p99': percentile(samples, 99),
+                'max': max(samples),
+            }
+        return rows
+
+
+class Pacer:
+    """
+    Spaces scan starts at a fixed overall rate, shared by all users.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, stop_at):
+        if not self.interval:
+            return time.monotonic() < stop_at
+        with self._lock:
+            slot = max(self.next_at, time.monotonic())
+            self.next_at = slot + self.interval
+        if slot >= stop_at:
+            return False
+        time.sleep(max(0.0, slot - time.monotonic()))
+        return True
+
+
+def load_images(folder, limit=None, scans_only=False):
+    """
+    Reads the folder's images once, as data URLs. With scans_only, files not
+    named like a saved scan are skipped.
+    """
+    images = []
+    for name in sorted(os.listdir(folder)):
+        content_type = IMAGE_TYPES.get(os.path.splitext(name)[1].lower())
+        if not content_type or (scans_only and not SCAN_IMAGE.match(name)):
+            continue
+        with open(os.path.join(folder, name), 'rb') as f:
+            images.append(f"data:{content_type};base64,{base64.b64encode(f.read()).decode('ascii')}")
+        if limit and len(images) >= limit:
+            break
+    return images
+
+
+class VirtualUser:
+    def __init__(self, base_url, number, run_id, stats, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.email = f"loadtest-{run_id}-{number}@example.com"
+        self.password = 'loadtest-password'
+        self.stats = stats
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _request(self, endpoint, method, path, **kwargs):
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.stats.record(endpoint, time.monotonic() - start, ok)
+        return response
+
+    def sign_in(self):
+        self.session.post(self.base_url + '/register', timeout=self.timeout, data={
+            'first_name': 'Load', 'last_name': 'Test', 'email': self.email,
+            'password': self.password, 'confirm_password': self.password,
+        })
+        response = self._request('login', 'POST', '/login',
+                                 data={'email': self.email, 'password': self.password})
+        if response is not None and '/onboarding' in response.url:
+            self.session.post(self.base_url + '/onboarding', timeout=self.timeout, data={
+                'age': 35, 'gender': 'other', 'allergies': '[]', 'dietary_preferences': 'None',
+                'chronic_conditions': 'None', 'medications': 'None', 'medical_history': 'None',
+            })
+        return response is not None and response.ok
+
+    def scan(self, image_data):
+        response = self._request('upload', 'POST', '/api/upload', json={'image_data': image_data},
+                                 allow_redirects=False)
+        if response is None or not response.ok:
+            return
+        try:
+            redirect_url = response.json().get('redirect_url') or '/breakdown'
+        except ValueError:
+            return
+
+        page = self._request('breakdown', 'GET', redirect_url)
+        if page is None or not page.ok:
+            return
+        match = AUDIO_SRC.search(page.text)
+        if match:
+            audio_path = match.group(1).replace(self.base_url, '')
+            self._request('audio', 'GET', audio_path)
+
+
+def run(base_url, users, rate, duration, images, timeout=120):
+    stats = Stats()
+    pacer = Pacer(rate)
+    run_id = uuid.uuid4().hex[:8]
+    counter = iter(range(10 ** 9))
+    counter_lock = threading.Lock()
+    start = time.monotonic()
+    stop_at = start + duration
+
+    def user_loop(number):
+        user = VirtualUser(base_url, number, run_id, stats, timeout)
+        if not user.sign_in():
+            return
+        while pacer.wait(stop_at):
+            with counter_lock:
+                index = next(counter)
+            user.scan(images[index % len(images)])
+
+    threads = [threading.Thread(target=user_loop, args=(n,), daemon=True) for n in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats.summary(time.monotonic() - start)
+
+
+def format_summary(summary):
+    def ms(value):
+        return '-' if value is None else f"{value * 1000:.0f}"
+
+    lines = [f"{'endpoint':<10} {'reqs':>6} {'req/s':>7} {'err%':>6} {'p50':>7} {'p90':>7} {'p95':>7} {'p99':>7} {'max':>7}  (ms)"]
+    for endpoint in ENDPOINTS:
+        row = summary.get(endpoint)
+        if row is None:
+            continue
+        lines.append(
+            f"{endpoint:<10} {row['requests']:>6} {row['throughput']:>7.2f} {row['error_rate'] * 100:>6.1f} "
+            f"{ms(row['p50']):>7} {ms(row['p90']):>7} {ms(row['p95']):>7} {ms(row['p99']):>7} {ms(row['max']):>7}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    default_images = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'uploads')
+    parser = argparse.ArgumentParser(description='Load-test the upload -> breakdown -> audio flow.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='base URL of the running app')
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users')
+    parser.add_argument('--rate', type=float, default=0, help='scans started per second overall (0 = unpaced)')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to keep starting scans')
+    parser.add_argument('--images', default=None,
+                        help='folder of images to replay (default: the scans saved in static/uploads)')
+    parser.add_argument('--max-images', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=120, help='per-request timeout in seconds')
+    parser.add_argument('--json', dest='json_path', help='also write the summary to this file')
+    args = parser.parse_args(argv)
+
+    # The uploads folder also holds avatars and grows as the run saves scans,
+    # so only the scans already in it are replayed
+    folder = args.images or default_images
+    images = load_images(folder, args.max_images, scans_only=args.images is None)
+    if not images:
+        raise SystemExit(f"No images found in {folder}")
+
+    print(f"{args.users} users, rate {args.rate or 'unpaced'}/s, {args.duration:.0f}s, "
+          f"{len(images)} images -> {args.url}")
+    summary = run(args.url, args.users, args.rate, args.duration, images, args.timeout)
+    print(format_summary(summary))
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+Local stand-ins for the upstream APIs, so load tests cost nothing.
+
+Serves, on one port:
+  POST /v1/chat/completions            OpenAI chat completions (identify, multi-identify, analyze)
+  POST /v1/text-to-speech/<voice_id>   ElevenLabs TTS (returns filler audio bytes)
+  GET  /search?q=&max_results=         search results in the SEARCH_API_URL format
+
+Point the app at it with:
+  OPENAI_BASE_URL=http://127.0.0.1:8900/v1
+  ELEVEN_LABS_BASE_URL=http://127.0.0.1:8900
+  SEARCH_API_URL=http://127.0.0.1:8900/search
+  OPENAI_API_KEY=stub ELEVEN_LABS_API_KEY=stub Voice_ID=stub
+
+Latency and errors are configured per service, e.g.
+  python -m loadtest.stubs --latency openai=lognormal:2.5:0.5 --latency tts=uniform:0.5:1.5 \\
+      --errors openai=0.02:500 --errors search=0.1:429
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SERVICES = ('openai', 'tts', 'search')
+
+PRODUCTS = [
+    'Oat Milk', 'Peanut Butter Crunch Cereal', 'Sea Salt Crisps', 'Greek Yogurt',
+    'Chocolate Hazelnut Spread', 'Whole Wheat Bread', 'Orange Juice', 'Granola Bar',
+]
+
+
+class Latency:
+    """
+    A latency distribution in seconds: fixed:<s>, uniform:<lo>:<hi> or
+    lognormal:<median>:<sigma> (long-tailed, like real LLM APIs).
+    """
+
+    def __init__(self, spec='fixed:0'):
+        kind, *params = spec.split(':')
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        if kind not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self):
+        if self.kind == 'fixed':
+            return self.params[0]
+        if self.kind == 'uniform':
+            return random.uniform(self.params[0], self.params[1])
+        median, sigma = self.params
+        return random.lognormvariate(math.log(median), sigma)
+
+
+class Faults:
+    """
+    Fails a fraction of requests with the given status: <rate>[:<status>].
+    """
+
+    def __init__(self, spec='0'):
+        rate, _, status = spec.partition(':')
+        self.rate = float(rate)
+        self.status = int(status or 500)
+
+    def status_for_request(self):
+        return self.status if random.random() < self.rate else None
+
+
+def _prompt_text(body):
+    """
+    All text parts of the request's messages, for telling the prompts apart.
+    """
+    parts = []
+    for message in body.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(part.get('text', '') for part in content or () if part.get('type') == 'text')
+    return '\n'.join(parts)
+
+def _content_for(body):
+    """
+    Picks a plausible completion for the app's three prompts.
+    """
+    product = random.choice(PRODUCTS)
+    if body.get('response_format', {}).get('type') != 'json_object':
+        return product
+    # Multi-identify asks for a 'products' list; analyze for the full breakdown
+    if "'products'" in _prompt_text(body):
+        return json.dumps({'products': random.sample(PRODUCTS, 3)})
+    return json.dumps({
+        'product_name': product,
+        'health_score': random.randint(1, 10),
+        'warnings': random.sample(['Contains nuts', 'High in sugar', 'High sodium', 'Contains dairy'], 2),
+        'summary': f"{product} is fine in moderation for your profile.",
+        'voice_response': f"{product}. Fine in moderation, but watch the sugar.",
+    })
+
+def chat_completion(body):
+    prompt_tokens = random.randint(900, 1400)
+    content = _content_for(body)
+    return {
+        'id': f"chatcmpl-stub{random.getrandbits(32):08x}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'gpt-4o'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop',
+        }],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(content) // 4,
+            'total_tokens': prompt_tokens + len(content) // 4,
+            'prompt_tokens_details': {'cached_tokens': random.choice((0, 1024))},
+        },
+    }
+
+def search_results(query, max_results):
+    return {'results': [
+        {
+            'title': f"{query} - result {i + 1}",
+            'href': f"https://example.com/{i + 1}",
+            'body': f"Ingredients and nutrition facts for {query}: sugar, salt, oats, water.",
+        }
+        for i in range(max_results)
+    ]}
+
+
+def make_handler(latency, faults, audio_bytes=16 * 1024):
+    audio = bytes(random.getrandbits(8) for _ in range(audio_bytes))
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type='application/json'):
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _simulate(self, service):
+            time.sleep(latency[service].sample())
+            status = faults[service].status_for_request()
+            if status:
+                self._send(status, {'error': {'message': 'stub fault', 'type': 'server_error'}})
+                return False
+            return True
+
+        def _read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                return json.loads(self.rfile.read(length) or b'{}')
+            except json.JSONDecodeError:
+                return {}
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            body = self._read_json()
+            if path.endswith('/chat/completions'):
+                if self._simulate('openai'):
+                    self._send(200, chat_completion(body))
+            elif '/text-to-speech/' in path:
+                if self._simulate('tts'):
+                    self._send(200, audio, 'audio/mpeg')
+            else:
+                self._send(404, {'error': 'not found'})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/search':
+                params = parse_qs(url.query)
+                if self._simulate('search'):
+                    max_results = int(params.get('max_results', ['5'])[0])
+                    self._send(200, search_results(params.get('q', [''])[0], max_results))
+            elif url.path == '/health':
+                self._send(200, {'ok': True})
+            else:
+                self._send(404, {'error': 'not found'})
+
+    return StubHandler
+
+
+def make_server(host='127.0.0.1', port=8900, latency=None, faults=None):
+    """
+    Builds the stub server. `latency` and `faults` map service name to a
+    Latency / Faults; services left out respond instantly and never fail.
+    """
+    latency = {service: (latency or {}).get(service) or Latency() for service in SERVICES}
+    faults = {service: (faults or {}).get(service) or Faults() for service in SERVICES}
+    server = ThreadingHTTPServer((host, port), make_handler(latency, faults))
+    server.daemon_threads = True
+    return server
+
+def start_in_thread(**kwargs):
+    """
+    Starts a stub server on a background thread and returns it (tests, notebooks).
+    """
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _per_service(values, parse):
+    parsed = {}
+    for value in values or []:
+        service, _, spec = value.partition('=')
+        if service not in SERVICES:
+            raise SystemExit(f"Unknown service '{service}', expected one of {', '.join(SERVICES)}")
+        parsed[service] = parse(spec)
+    return parsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stub OpenAI, ElevenLabs and search servers for load tests.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', action='append', metavar='SERVICE=DIST',
+                        help='e.g. openai=lognormal:2.5:0.5, tts=uniform:0.5:1.5, search=fixed:0.3')
+    parser.add_argument('--errors', action='append', metavar='SERVICE=RATE[:STATUS]',
+                        help='e.g. openai=0.02:500, search=0.1:429')
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port,
+                         _per_service(args.latency, Latency), _per_service(args.errors, Faults))
+    print(f"Stub upstreams listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import mimetypes
+import os
+from flask import Blueprint, current_app, abort, make_response, redirect, send_file, url_for
+from werkzeug.security import safe_join
+from storage import IMMUTABLE_CACHE_CONTROL, get_storage
+
+media = Blueprint('media', __name__)
+
+# Media kinds and the storage prefix that holds them
+MEDIA_FOLDERS = {
+    'uploads': 'uploads',
+    'audio': 'audio',
+}
+
+mimetypes.add_type('audio/ogg', '.ogg')
+mimetypes.add_type('image/webp', '.webp')
+
+def media_url(kind, filename):
+    return url_for('media.serve', kind=kind, filename=filename)
+
+def media_type(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+@media.route('/media/<kind>/<path:filename>')
+def serve(kind, filename):
+    """
+    Serves scan images, audio and avatars from blob storage.
+
+    With MEDIA_ACCEL_REDIRECT_PREFIX set, the response is an empty
+    X-Accel-Redirect hand-off so nginx streams the file and the worker is
+    released immediately. Otherwise Flask sends it with ETag/Last-Modified
+    and Range support (and X-Sendfile when USE_X_SENDFILE is on). Files in
+    object storage are redirected to a presigned URL instead.
+    """
+    folder = MEDIA_FOLDERS.get(kind)
+    key = safe_join(folder, filename) if folder else None
+    if key is None:
+        abort(404)
+
+    storage = get_storage()
+    try:
+        path = storage.local_path(key)
+    except ValueError:
+        abort(404)
+
+    if path is None:
+        # Object storage: let the client fetch it straight from the bucket
+        return redirect(storage.url(key))
+
+    if not os.path.isfile(path):
+        abort(404)
+
+    accel_prefix = current_app.config.get('MEDIA_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{key}"
+        response.headers['Content-Type'] = media_type(filename)
+    else:
+        response = send_file(path, mimetype=media_type(filename), conditional=True)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
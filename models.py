@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -34,3 +35,82 @@ class User(UserMixin, db.Model):
 
     def __repr__(self):
         return f'<User {self.email}>'
+
+
+class Scan(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    product_name = db.Column(db.String(255), nullable=True)
+    image_filename = db.Column(db.String(255), nullable=True)
+    audio_filename = db.Column(db.String(255), nullable=True)
+    analysis_text = db.Column(db.Text, nullable=True)
+    warning_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # OpenAI token accounting for the calls made by this scan
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    cached_tokens = db.Column(db.Integer, nullable=True)
+    completion_tokens = db.Column(db.Integer, nullable=True)
+
+    # Comma-separated optional stages skipped under load (e.g. 'search,tts')
+    degraded_stages = db.Column(db.String(64), nullable=True)
+    # 'pending' while audio for a scan that shed TTS is generated in the background,
+    # 'unavailable' once that has given up
+    audio_status = db.Column(db.String(16), nullable=True)
+
+    # History is always read per user, newest first, so keyset pagination
+    # on (created_at, id) walks this index instead of scanning the table.
+    __table_args__ = (
+        db.Index('ix_scan_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<Scan {self.id} {self.product_name}>'
+
+
+class ScanStats(db.Model):
+    """
+    Denormalized per-user scan aggregates, updated on every scan so the
+    dashboard never has to count over the scan table.
+    """
+    # Cap on distinct products tracked for "most scanned"
+    MAX_TRACKED_PRODUCTS = 50
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    total_scans = db.Column(db.Integer, nullable=False, default=0)
+    total_warnings = db.Column(db.Integer, nullable=False, default=0)
+    warnings_by_type = db.Column(db.Text, nullable=False, default='{}')
+    product_counts = db.Column(db.Text, nullable=False, default='{}')
+    last_scan_at = db.Column(db.DateTime, nullable=True)
+
+    def record(self, scan, warning_types):
+        """
+        Folds a single scan into the aggregates.
+        """
+        self.total_scans = (self.total_scans or 0) + 1
+        self.total_warnings = (self.total_warnings or 0) + len(warning_types)
+        self.last_scan_at = scan.created_at
+
+        by_type = json.loads(self.warnings_by_type or '{}')
+        for warning_type in warning_types:
+            by_type[warning_type] = by_type.get(warning_type, 0) + 1
+        self.warnings_by_type = json.dumps(by_type)
+
+        if scan.product_name:
+            counts = json.loads(self.product_counts or '{}')
+            counts[scan.product_name] = counts.get(scan.product_name, 0) + 1
+            if len(counts) > self.MAX_TRACKED_PRODUCTS:
+                # Drop the least scanned product other than the one just recorded
+                victim = min((name for name in counts if name != scan.product_name), key=counts.get)
+                del counts[victim]
+            self.product_counts = json.dumps(counts)
+
+    def warnings(self):
+        return json.loads(self.warnings_by_type or '{}')
+
+    def top_products(self, limit=5):
+        counts = json.loads(self.product_counts or '{}')
+        return sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def __repr__(self):
+        return f'<ScanStats {self.user_id} {self.total_scans}>'
@@ -0,0 +1,205 @@
+import base64
+import importlib.util
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from io import BytesIO
+from flask import current_app
+
+# Tesseract reads best with text around 30px high; labels photographed on a
+# phone are usually far larger, receipts-style close-ups sometimes smaller.
+TARGET_MIN_SIDE = 1000
+TARGET_MAX_SIDE = 2000
+
+
+def otsu_threshold(histogram):
+    """
+    Threshold that best separates a 256-bin greyscale histogram into two classes
+    (ink and background) by maximising the between-class variance.
+    """
+    total = sum(histogram)
+    if not total:
+        return 128
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background = weight_background = 0
+    best_threshold, best_variance = 0, -1.0
+    for threshold, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += threshold * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = threshold, variance
+    return best_threshold
+
+def label_region(image, edge_level=40, padding=0.03, min_area=0.1):
+    """
+    Crops a greyscale image to the box around its dense edges, where the
+    printed label text is, dropping plain background. Falls back to the whole
+    image when the box would be implausibly small.
+    """
+    from PIL import ImageFilter
+    width, height = image.size
+    # The filter leaves the outermost pixels unfiltered, so they are left out
+    edges = image.filter(ImageFilter.FIND_EDGES).crop((1, 1, width - 1, height - 1))
+    box = edges.point(lambda p: 255 if p > edge_level else 0).getbbox()
+    if box is None:
+        return image
+    left, top, right, bottom = (box[0] + 1, box[1] + 1, box[2] + 1, box[3] + 1)
+    if (right - left) * (bottom - top) < min_area * width * height:
+        return image
+    pad_x, pad_y = int(width * padding), int(height * padding)
+    return image.crop((max(0, left - pad_x), max(0, top - pad_y),
+                       min(width, right + pad_x), min(height, bottom + pad_y)))
+
+def preprocess(image_bytes):
+    """
+    Greyscale, label crop, rescale and Otsu binarization, ready for Tesseract.
+    """
+    from PIL import Image, ImageOps
+    image = ImageOps.exif_transpose(Image.open(BytesIO(image_bytes)))
+    image = ImageOps.autocontrast(image.convert('L'))
+    image = label_region(image)
+
+    short_side, long_side = min(image.size), max(image.size)
+    scale = 1.0
+    if short_side < TARGET_MIN_SIDE:
+        scale = TARGET_MIN_SIDE / short_side
+    if long_side * scale > TARGET_MAX_SIDE:
+        scale = TARGET_MAX_SIDE / long_side
+    if scale != 1.0:
+        image = image.resize((int(image.width * scale), int(image.height * scale)), Image.LANCZOS)
+
+    threshold = otsu_threshold(image.histogram())
+    return image.point(lambda p: 255 if p > threshold else 0)
+
+def extract_text(image_bytes, lang='eng', tesseract_cmd=None, timeout=0):
+    """
+    Runs in an OCR worker process. Returns {'text', 'confidence', 'words'},
+    confidence being Tesseract's mean word confidence (0-100) weighted by length.
+    A tesseract run longer than `timeout` seconds is killed (0 means no limit).
+    """
+    import pytesseract
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    data = pytesseract.image_to_data(preprocess(image_bytes), lang=lang, output_type=pytesseract.Output.DICT,
+                                     timeout=timeout)
+
+    lines = {}
+    weighted, chars = 0.0, 0
+    for i, word in enumerate(data['text']):
+        word = (word or '').strip()
+        confidence = float(data['conf'][i])
+        if not word or confidence < 0:
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+        weighted += confidence * len(word)
+        chars += len(word)
+
+    return {
+        'text': '\n'.join(' '.join(words) for _, words in sorted(lines.items())),
+        'confidence': round(weighted / chars, 1) if chars else 0.0,
+        'words': sum(len(words) for words in lines.values()),
+    }
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Reads submitted and not yet finished, including ones the caller stopped waiting for
+_pending = 0
+
+def _get_pool(app):
+    # Worker processes are not inherited across a gunicorn fork; build per process
+    global _pool, _pool_pid, _pending
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ProcessPoolExecutor(
+                    max_workers=app.config.get('OCR_WORKERS', 2),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                _pool_pid = os.getpid()
+                _pending = 0
+    return _pool
+
+def _read_finished(future):
+    global _pending
+    with _pool_lock:
+        _pending -= 1
+
+def ocr_available(app=None):
+    """
+    Whether OCR is enabled and pytesseract and the tesseract binary are installed
+    (checked once per app).
+    """
+    app = app or current_app._get_current_object()
+    available = app.extensions.get('ocr_available')
+    if available is None:
+        available = app.extensions['ocr_available'] = bool(
+            app.config.get('OCR_ENABLED', True)
+            and importlib.util.find_spec('pytesseract') is not None
+            and (app.config.get('TESSERACT_CMD') or shutil.which('tesseract'))
+        )
+    return available
+
+def submit_label_read(image_data_base64):
+    """
+    Starts OCR of a scan image on the process pool. Returns a Future, or None
+    when OCR is disabled, Tesseract is not installed or every OCR worker is busy.
+
+    A read the caller gave up on keeps its worker until Tesseract exits (a
+    running task cannot be cancelled), so new reads are skipped rather than
+    queued behind it, and each run is killed after OCR_TIMEOUT.
+    """
+    global _pending
+    app = current_app._get_current_object()
+    if not ocr_available(app):
+        return None
+    encoded = image_data_base64.split(',', 1)[1] if ',' in image_data_base64 else image_data_base64
+    image_bytes = base64.b64decode(encoded)
+    pool = _get_pool(app)
+    with _pool_lock:
+        if _pending >= app.config.get('OCR_WORKERS', 2):
+            return None
+        _pending += 1
+    try:
+        future = pool.submit(extract_text, image_bytes, app.config.get('OCR_LANG', 'eng'),
+                             app.config.get('TESSERACT_CMD'), app.config.get('OCR_TIMEOUT', 5))
+    except Exception:
+        _read_finished(None)
+        raise
+    future.add_done_callback(_read_finished)
+    return future
+
+def confident_label_text(future, timeout=None):
+    """
+    Waits for an OCR result and returns its text if it is clear enough to
+    analyze without the image (OCR_MIN_CONFIDENCE and OCR_MIN_WORDS), else None.
+    """
+    if future is None:
+        return None
+    config = current_app.config
+    try:
+        result = future.result(timeout=config.get('OCR_TIMEOUT', 5) if timeout is None else timeout)
+    except FutureTimeoutError:
+        current_app.logger.info("OCR timed out; using the vision model")
+        return None
+    except Exception as e:
+        current_app.logger.error(f"OCR Error: {e}")
+        return None
+
+    current_app.logger.info(f"OCR: {result['words']} words, confidence {result['confidence']}")
+    if result['confidence'] < config.get('OCR_MIN_CONFIDENCE', 80) or result['words'] < config.get('OCR_MIN_WORDS', 8):
+        return None
+    return result['text']
@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+import time
+from io import BytesIO
+from flask import current_app
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# Up to 7 bits a lookup probes one-bit chunk neighbours (~0.25 ms over 300k entries);
+# from 8 it probes two-bit ones and takes ~2 ms, so configured distances are capped here
+MAX_CONFIGURED_DISTANCE = 7
+
+
+def dhash(image_bytes):
+    """
+    64-bit difference hash: the image is shrunk to 9x8 greyscale and each bit
+    records whether a pixel is brighter than its right-hand neighbour. Small
+    changes in angle, lighting, scale or JPEG quality flip only a few bits.
+    """
+    from PIL import Image, ImageOps
+    image = Image.open(BytesIO(image_bytes))
+    # Let the JPEG decoder downscale instead of decoding the full-resolution photo
+    image.draft('L', (90, 80))
+    image = ImageOps.exif_transpose(image)
+    pixels = image.convert('L').resize((9, 8), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+def informative(value, min_bits=12):
+    """
+    Whether a hash carries enough detail to match on. Plain, blurry or
+    low-texture photos hash to nearly all zeros (all ones for a smooth
+    gradient), so unrelated ones land within a few bits of each other.
+    """
+    return min_bits <= bin(value).count('1') <= HASH_BITS - min_bits
+
+def _chunks(value):
+    return [(value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+def _neighbours(chunk, radius):
+    """
+    Every chunk value within `radius` bit flips of `chunk` (radius 0-2).
+    """
+    values = [chunk]
+    if radius >= 1:
+        values.extend(chunk ^ (1 << i) for i in range(CHUNK_BITS))
+    if radius >= 2:
+        values.extend(chunk ^ (1 << i) ^ (1 << j) for i in range(CHUNK_BITS) for j in range(i + 1, CHUNK_BITS))
+    return values
+
+
+class HashIndex:
+    """
+    Multi-index hash table of image hashes -> product names.
+
+    Each 64-bit hash is split into four 16-bit chunks, each with its own table.
+    Two hashes within Hamming distance t must agree on at least one chunk to
+    within floor(t/4) bits, so a lookup probes only those chunk neighbours and
+    verifies the few candidates, instead of comparing against every entry.
+
+    Entries are appended to a JSONL file and reloaded on start. Entries added
+    by other worker processes are picked up from the same file on lookup.
+    Hashes with fewer than `min_bits` bits set (or unset) are neither stored
+    nor looked up; see informative().
+    """
+
+    def __init__(self, path=None, max_distance=6, refresh_interval=5, min_bits=12):
+        if max_distance >= 3 * CHUNKS:
+            raise ValueError('max_distance must be below 12 (chunk radius is capped at 2)')
+        self.path = path
+        self.max_distance = max_distance
+        self.min_bits = min_bits
+        self.refresh_interval = refresh_interval
+        self.hashes = []
+        self.products = []
+        self.tables = [{} for _ in range(CHUNKS)]
+        self._known = set()
+        self._offset = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.refresh(force=True)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _insert(self, value, product_name):
+        if (value, product_name) in self._known or not informative(value, self.min_bits):
+            return False
+        self._known.add((value, product_name))
+        entry = len(self.hashes)
+        self.hashes.append(value)
+        self.products.append(product_name)
+        for table, chunk in zip(self.tables, _chunks(value)):
+            table.setdefault(chunk, []).append(entry)
+        return True
+
+    def refresh(self, force=False):
+        """
+        Loads entries appended to the file since the last read.
+        """
+        if not self.path:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = now
+        try:
+            if os.path.getsize(self.path) <= self._offset:
+                return
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A line still being written by another worker is read next time
+        complete = data[:data.rfind(b'\n') + 1]
+        with self._lock:
+            for line in complete.splitlines():
+                try:
+                    record = json.loads(line)
+                    self._insert(int(record['hash'], 16), record['product'])
+                except (ValueError, KeyError, TypeError):
+                    continue
+            self._offset += len(complete)
+
+    def add(self, value, product_name):
+        with self._lock:
+            if not self._insert(value, product_name) or not self.path:
+                return
+            line = json.dumps({'hash': f"{value:016x}", 'product': product_name}) + '\n'
+            # One O_APPEND write per entry so concurrent workers never interleave lines
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode('utf-8'))
+            finally:
+                os.close(fd)
+
+    def lookup(self, value, max_distance=None):
+        """
+        Returns (product_name, distance) of the nearest entry within
+        max_distance, or None. Ties go to the most recently added entry.
+        """
+        if not informative(value, self.min_bits):
+            return None
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        self.refresh()
+        radius = max_distance // CHUNKS
+        best = None
+        seen = set()
+        for table, chunk in zip(self.tables, _chunks(value)):
+            for neighbour in _neighbours(chunk, radius):
+                for entry in table.get(neighbour, ()):
+                    if entry in seen:
+                        continue
+                    seen.add(entry)
+                    distance = hamming(value, self.hashes[entry])
+                    if distance <= max_distance and (best is None or (distance, -entry) < (best[1], -best[0])):
+                        best = (entry, distance)
+        if best is None:
+            return None
+        return self.products[best[0]], best[1]
+
+    def confidence(self, distance):
+        """
+        1.0 for an identical hash, falling to 0.5 at max_distance.
+        """
+        return round(1 - 0.5 * distance / max(1, self.max_distance), 2)
+
+
+def create_hash_index(app):
+    return HashIndex(
+        app.config.get('PHASH_INDEX_PATH') or os.path.join(app.instance_path, 'phash_index.jsonl'),
+        max_distance=min(app.config.get('PHASH_MAX_DISTANCE', 6), MAX_CONFIGURED_DISTANCE),
+        min_bits=app.config.get('PHASH_MIN_BITS', 12)
+    )
+
+def get_hash_index(app=None):
+    """
+    Returns the product hash index for the app (loaded once per process).
+    """
+    app = app or current_app._get_current_object()
+    index = app.extensions.get('phash_index')
+    if index is None:
+        index = app.extensions['phash_index'] = create_hash_index(app)
+    return index
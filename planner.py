@@ -0,0 +1,236 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from flask import current_app
+from resilience import CircuitBreaker, CircuitOpenError, get_breaker
+
+# Stages that can be dropped from a scan, in the order they are shed.
+# Identify only goes once search has: search needs the product name.
+OPTIONAL_STAGES = ('tts', 'search', 'identify')
+
+# Upstream provider behind each optional stage, for circuit-breaker checks
+STAGE_PROVIDERS = {
+    'tts': 'elevenlabs',
+    'search': 'search',
+}
+
+# Latency assumed for a stage before any call has been observed (seconds)
+DEFAULT_STAGE_LATENCY = {
+    'identify': 2.0,
+    'search': 1.5,
+    'analyze': 8.0,
+    'tts': 2.5,
+}
+
+
+class ScanCounter:
+    """
+    Scans in flight across every worker process on the node, kept in a SQLite
+    file. Each scan holds a row while it runs; rows expire after `ttl` seconds
+    so a worker killed mid-scan does not inflate the count for good.
+    """
+
+    def __init__(self, path, ttl=120):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS in_flight (token TEXT PRIMARY KEY, expires_at REAL NOT NULL)'
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def acquire(self):
+        token = uuid.uuid4().hex
+        self._connect().execute('INSERT INTO in_flight (token, expires_at) VALUES (?, ?)',
+                                (token, time.time() + self.ttl))
+        return token
+
+    def release(self, token):
+        self._connect().execute('DELETE FROM in_flight WHERE token = ?', (token,))
+
+    def count(self):
+        conn = self._connect()
+        conn.execute('DELETE FROM in_flight WHERE expires_at < ?', (time.time(),))
+        return conn.execute('SELECT COUNT(*) FROM in_flight').fetchone()[0]
+
+
+class LoadMonitor:
+    """
+    View of scan load: how many scans are in flight and an exponentially
+    weighted moving average of each upstream stage's latency.
+
+    Both are per process. Passing the app's ScanCounter to track() and
+    node_in_flight() makes the count node-wide: with sync gunicorn workers a
+    process only ever runs one scan, so its own count says nothing about how
+    busy the node is.
+    """
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.latencies = {}
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def node_in_flight(self, counter=None):
+        if counter is not None:
+            try:
+                return counter.count()
+            except sqlite3.Error:
+                pass
+        return self.in_flight
+
+    @contextmanager
+    def track(self, counter=None):
+        token = None
+        if counter is not None:
+            try:
+                token = counter.acquire()
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            if token is not None:
+                try:
+                    counter.release(token)
+                except sqlite3.Error:
+                    pass
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            previous = self.latencies.get(stage)
+            if previous is None:
+                self.latencies[stage] = seconds
+            else:
+                self.latencies[stage] = previous + self.alpha * (seconds - previous)
+
+    def latency(self, stage):
+        return self.latencies.get(stage, DEFAULT_STAGE_LATENCY.get(stage, 0.0))
+
+
+monitor = LoadMonitor()
+
+def get_scan_counter(app=None):
+    """
+    Returns the app's node-wide count of in-flight scans (SCAN_COUNTER_PATH,
+    default instance/in_flight.sqlite), built once per app on first use.
+    """
+    app = app or current_app._get_current_object()
+    counter = app.extensions.get('scan_counter')
+    if counter is None:
+        counter = app.extensions['scan_counter'] = ScanCounter(
+            app.config.get('SCAN_COUNTER_PATH') or os.path.join(app.instance_path, 'in_flight.sqlite'),
+            # A scan cannot outlive the server timeout; 0 means gunicorn has none
+            ttl=app.config.get('SERVER_TIMEOUT_SECONDS') or 120
+        )
+    return counter
+
+@contextmanager
+def timed(stage):
+    """
+    Records how long the wrapped upstream call took, successful or not.
+    Calls refused by an open circuit never reached the upstream, so their
+    near-zero time is not recorded.
+    """
+    start = time.monotonic()
+    reached = True
+    try:
+        yield
+    except CircuitOpenError:
+        reached = False
+        raise
+    finally:
+        if reached:
+            monitor.observe(stage, time.monotonic() - start)
+
+
+class ScanPlan:
+    """
+    Which optional stages a scan runs. Skipped stages make the result degraded.
+    """
+
+    def __init__(self, skipped=(), estimate=None):
+        self.skipped = [stage for stage in OPTIONAL_STAGES if stage in skipped]
+        self.estimate = estimate
+
+    @property
+    def identify(self):
+        return 'identify' not in self.skipped
+
+    @property
+    def search(self):
+        return 'search' not in self.skipped
+
+    @property
+    def tts(self):
+        return 'tts' not in self.skipped
+
+    @property
+    def degraded(self):
+        return bool(self.skipped)
+
+    def __repr__(self):
+        return f'<ScanPlan skipped={self.skipped} estimate={self.estimate}>'
+
+
+def estimate_latency(stages, load_monitor=None, concurrency=4, in_flight=None):
+    """
+    Expected scan latency for the given stages at the current load. When more
+    scans are in flight than the node can serve concurrently, each one waits
+    proportionally longer.
+    """
+    load_monitor = load_monitor or monitor
+    if in_flight is None:
+        in_flight = load_monitor.in_flight
+    queue_factor = max(1.0, in_flight / max(1, concurrency))
+    return sum(load_monitor.latency(stage) for stage in stages) * queue_factor
+
+def plan_scan(config, load_monitor=None, counter=None):
+    """
+    Picks the stages for a new scan so its expected latency stays within
+    SCAN_LATENCY_SLO_SECONDS. Optional stages are shed in OPTIONAL_STAGES
+    order until the estimate fits; stages whose provider circuit is open are
+    always skipped. The analyze call is never dropped. With a ScanCounter the
+    load is the node's, not just this process's.
+    """
+    if not config.get('DEGRADE_ENABLED', True):
+        return ScanPlan()
+
+    slo = config.get('SCAN_LATENCY_SLO_SECONDS', 20)
+    concurrency = config.get('SCAN_CONCURRENCY', 4)
+
+    skipped = set()
+    for stage, provider in STAGE_PROVIDERS.items():
+        breaker = get_breaker(provider, config.get('CIRCUIT_FAILURE_THRESHOLD', 5), config.get('CIRCUIT_RESET_SECONDS', 30))
+        if breaker.state == CircuitBreaker.OPEN:
+            skipped.add(stage)
+
+    def remaining():
+        return ['analyze'] + [stage for stage in OPTIONAL_STAGES if stage not in skipped]
+
+    load_monitor = load_monitor or monitor
+    in_flight = load_monitor.node_in_flight(counter)
+    estimate = estimate_latency(remaining(), load_monitor, concurrency, in_flight)
+    for stage in OPTIONAL_STAGES:
+        if estimate <= slo:
+            break
+        skipped.add(stage)
+        estimate = estimate_latency(remaining(), load_monitor, concurrency, in_flight)
+    return ScanPlan(skipped, round(estimate, 2))
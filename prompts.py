@@ -0,0 +1,165 @@
+import re
+
+# Static instructions and JSON schema for the final analysis call. This block is
+# identical for every scan, so it goes first (in the system message) where the
+# provider can serve it from its prompt prefix cache. Anything per-user or
+# per-product belongs in the user message after it.
+# OpenAI only caches prefixes of at least 1024 tokens. This block alone is about
+# 350, so cached_tokens stays 0 unless OPENAI_SYSTEM_PROMPT, which comes before it,
+# makes the prefix long enough.
+ANALYSIS_INSTRUCTIONS = (
+    "You will be given a photo of a food product, the user's health profile and, "
+    "when available, web search results about the product.\n"
+    "1. Confirm the product identity visually.\n"
+    "2. Use the web search results to find ingredients and nutritional info if not visible on the pack.\n"
+    "3. Combine this with your internal knowledge to provide a complete analysis.\n\n"
+    "Provide a structured JSON response with the following fields:\n"
+    "- product_name: The name of the product.\n"
+    "- list_ingredients: A list of ingredients in layman easy to understand English.\n"
+    "- warnings: A list of strings (health warnings based on user profile).\n"
+    "- summary: A conversational summary of whether it's healthy and a recommendation (plain text, no markdown).\n"
+    "- voice_response: A friendly audio summary suitable for the user based on their profile.\n\n"
+    "Return ONLY the JSON object, no markdown formatting. These output instructions take "
+    "precedence over any other response format described above. "
+    "If you don't recognize the food or cannot extract details, return 'Unknown Product' for product_name."
+)
+
+# Rough characters-per-token ratio for English text, used for budgeting only
+CHARS_PER_TOKEN = 4
+MAX_SNIPPET_TOKENS = 80
+MAX_LABEL_TOKENS = 600
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _normalize(text):
+    return re.sub(r'\W+', ' ', text.lower()).strip()
+
+def trim_snippets(results, token_budget):
+    """
+    Dedupes search results and trims them to fit a token budget.
+    Results are kept in rank order; each body is capped so one long page
+    cannot crowd out the rest.
+    """
+    snippets = []
+    seen = set()
+    used = 0
+    max_chars = MAX_SNIPPET_TOKENS * CHARS_PER_TOKEN
+
+    for result in results:
+        title = (result.get('title') or '').strip()
+        body = ' '.join((result.get('body') or '').split())
+        if not body:
+            continue
+
+        key = _normalize(body)[:200]
+        if key in seen:
+            continue
+        seen.add(key)
+
+        if len(body) > max_chars:
+            body = body[:max_chars].rsplit(' ', 1)[0] + '...'
+
+        line = f"- {title}: {body}" if title else f"- {body}"
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            break
+        snippets.append(line)
+        used += cost
+
+    return snippets
+
+def build_system_prompt(base_prompt):
+    """
+    The stable prefix: the configured persona followed by the static instructions.
+    """
+    base_prompt = (base_prompt or '').strip()
+    if not base_prompt:
+        return ANALYSIS_INSTRUCTIONS
+    return f"{base_prompt}\n\n{ANALYSIS_INSTRUCTIONS}"
+
+def build_analysis_messages(system_prompt, user_context, product_name, snippets, image_url=None, label_text=None):
+    """
+    Builds the chat messages for the final analysis: static system block first,
+    then the variable user context, search results and image last.
+
+    With label_text (OCR output) and no image the request is text-only, so it
+    can go to a cheaper model; the system block is unchanged to keep the cache.
+    """
+    parts = [user_context]
+    if snippets:
+        parts.append(f"Web Search Results for '{product_name}':\n" + "\n".join(snippets))
+    elif product_name and product_name.lower() != 'unknown':
+        parts.append(f"Identified product: {product_name}")
+    if label_text:
+        label_text = label_text[:MAX_LABEL_TOKENS * CHARS_PER_TOKEN]
+        parts.append(
+            "No photo is attached. Text read from the product label by OCR "
+            "(may contain recognition errors):\n" + label_text
+        )
+
+    if not image_url:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "\n\n".join(parts)}
+        ]
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "\n\n".join(parts)},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url
+                    }
+                }
+            ]
+        }
+    ]
+
+
+class TokenUsage:
+    """
+    Accumulates token counts across the OpenAI calls made for one scan.
+    """
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.calls = []
+
+    def add(self, stage, response):
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return None
+        details = getattr(usage, 'prompt_tokens_details', None)
+        call = {
+            'stage': stage,
+            'prompt_tokens': usage.prompt_tokens or 0,
+            'cached_tokens': (getattr(details, 'cached_tokens', None) or 0) if details else 0,
+            'completion_tokens': usage.completion_tokens or 0
+        }
+        self.prompt_tokens += call['prompt_tokens']
+        self.cached_tokens += call['cached_tokens']
+        self.completion_tokens += call['completion_tokens']
+        self.calls.append(call)
+        return call
+
+    def merge(self, other):
+        if other is None:
+            return
+        self.prompt_tokens += other.prompt_tokens
+        self.cached_tokens += other.cached_tokens
+        self.completion_tokens += other.completion_tokens
+        self.calls.extend(other.calls)
+
+    def as_dict(self):
+        return {
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+            'completion_tokens': self.completion_tokens
+        }
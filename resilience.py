@@ -0,0 +1,221 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class UpstreamError(Exception):
+    """
+    An upstream provider (OpenAI, ElevenLabs, search) failed or was skipped.
+    """
+
+
+class UpstreamHTTPError(UpstreamError):
+    def __init__(self, provider, status_code, message=''):
+        super().__init__(f"{provider} returned {status_code}: {message}")
+        self.status_code = status_code
+
+
+class CircuitOpenError(UpstreamError):
+    def __init__(self, provider):
+        super().__init__(f"{provider} circuit is open")
+
+
+class DeadlineExceeded(UpstreamError):
+    pass
+
+
+class Deadline:
+    """
+    A time budget for one scan, shared by its stages. Each stage gets the
+    smaller of its own cap and whatever is left of the overall budget.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, stage_cap=None):
+        """
+        Timeout for the next call. Raises DeadlineExceeded if nothing is left.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"scan deadline of {self.seconds}s exceeded")
+        return min(remaining, stage_cap) if stage_cap else remaining
+
+
+class CircuitBreaker:
+    """
+    Fails fast while a provider is down.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are refused for `reset_timeout` seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name, failure_threshold=5, reset_timeout=30):
+    """
+    Returns the per-process circuit breaker for a provider.
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name, failure_threshold, reset_timeout))
+    return breaker
+
+
+# Exception class names (from requests, httpx and the openai SDK) that mean a
+# transient network problem worth retrying.
+TRANSIENT_ERRORS = {
+    'Timeout', 'ConnectTimeout', 'ReadTimeout', 'ConnectionError', 'TimeoutError',
+    'APITimeoutError', 'APIConnectionError', 'RemoteProtocolError', 'DeadlineExceeded',
+}
+
+def _status_code(error):
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+def is_retryable(error):
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+def backoff_delay(attempt, base_delay=0.5, max_delay=4.0):
+    """
+    Exponential backoff with full jitter: uniform in [0, min(max, base * 2^attempt)].
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+def call_with_retries(fn, breaker, retries=2, deadline=None, stage_cap=None,
+                      base_delay=0.5, max_delay=4.0, sleep=time.sleep):
+    """
+    Calls fn(timeout) through a circuit breaker, retrying transient failures
+    (timeouts, connection errors, 429 and 5xx) with jittered backoff while
+    the deadline allows. Other errors are raised immediately.
+    """
+    attempt = 0
+    while True:
+        timeout = deadline.timeout(stage_cap) if deadline else stage_cap
+        if not breaker.allow():
+            raise CircuitOpenError(breaker.name)
+        try:
+            result = fn(timeout)
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:
+                breaker.record_failure()
+            else:
+                # The provider answered; the request itself was bad
+                breaker.record_success()
+            if not retryable or attempt >= retries:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            if deadline and delay >= deadline.remaining():
+                raise
+            sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
+
+
+_hedge_executor = None
+_hedge_pid = None
+
+def _get_hedge_executor():
+    # Rebuilt after a fork: worker threads do not survive into the child
+    global _hedge_executor, _hedge_pid
+    if _hedge_executor is None or _hedge_pid != os.getpid():
+        with _breakers_lock:
+            if _hedge_executor is None or _hedge_pid != os.getpid():
+                _hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hedge')
+                _hedge_pid = os.getpid()
+    return _hedge_executor
+
+def hedged_call(fn, hedge_delay, timeout):
+    """
+    Starts fn(); if it has not finished after hedge_delay seconds, starts a
+    duplicate and returns whichever succeeds first. Raises DeadlineExceeded
+    if neither finishes within timeout. The losing call is left to finish
+    in the background. A timeout of None waits indefinitely.
+    """
+    executor = _get_hedge_executor()
+    start = time.monotonic()
+    futures = [executor.submit(fn)]
+    done, _ = wait(futures, timeout=hedge_delay if timeout is None else min(hedge_delay, timeout))
+    if not done:
+        futures.append(executor.submit(fn))
+
+    error = None
+    pending = set(futures)
+    while pending:
+        remaining = None if timeout is None else timeout - (time.monotonic() - start)
+        if remaining is not None and remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    if error is not None and not pending:
+        raise error
+    raise DeadlineExceeded(f"no response within {timeout:.1f}s")
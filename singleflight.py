@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from flask import current_app
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key within a process: the first
+    caller runs the function, the rest wait on its future and share the result
+    (or the exception). A caller that waits longer than the timeout runs the
+    function itself.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            try:
+                return future.result(timeout=timeout)
+            except FuturesTimeoutError:
+                return fn()
+
+        try:
+            result = fn()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+_group = SingleFlight()
+
+def _cache_call(method, *args):
+    try:
+        return method(*args)
+    except Exception as e:
+        current_app.logger.error(f"Cache Error: {e}")
+        return None
+
+def _wait_for_value(cache, key, lease, wait, poll_interval):
+    """
+    Polls the cache while another process holds the lease. Returns the value,
+    or None if the lease went away without one or the wait ran out.
+    """
+    give_up_at = time.monotonic() + wait
+    while time.monotonic() < give_up_at:
+        time.sleep(poll_interval)
+        value = _cache_call(cache.get, key)
+        if value is not None:
+            return value
+        if _cache_call(cache.get, lease) is None:
+            # The holder finished without a result (or crashed and the lease expired)
+            return _cache_call(cache.get, key)
+    return None
+
+def coalesce(key, compute, cache=None, ttl=None, lease_ttl=45, wait=30, poll_interval=0.1):
+    """
+    Returns the value for a cache key, running compute() at most once for all
+    concurrent callers.
+
+    Threads in this process share one in-flight call. With a cache, other
+    processes (and nodes, with Redis) are coordinated through a lease key taken
+    with cache.add: the holder computes and stores the value, the others poll
+    the cache for it for up to `wait` seconds before computing it themselves.
+    A None result is shared in-process but not cached.
+    """
+    def run():
+        if cache is None:
+            return compute()
+
+        value = _cache_call(cache.get, key)
+        if value is not None:
+            return value
+
+        lease = f"lease:{key}"
+        # None means the cache failed; compute without coordinating rather than wait
+        holder = _cache_call(cache.add, lease, os.getpid(), lease_ttl)
+        if holder is False:
+            value = _wait_for_value(cache, key, lease, wait, poll_interval)
+            if value is not None:
+                return value
+
+        try:
+            value = compute()
+            if value is not None:
+                _cache_call(cache.set, key, value, ttl)
+            return value
+        finally:
+            if holder:
+                _cache_call(cache.delete, lease)
+
+    return _group.do(key, run, timeout=wait)
+
+def flight_options(deadline=None):
+    """
+    Lease and wait settings from config; waiting never outlasts the scan deadline.
+    """
+    config = current_app.config
+    wait = config.get('SINGLE_FLIGHT_WAIT_SECONDS', 30)
+    if deadline:
+        wait = min(wait, deadline.remaining())
+    return {
+        'lease_ttl': config.get('SINGLE_FLIGHT_LEASE_SECONDS', 45),
+        'wait': wait,
+        'poll_interval': config.get('SINGLE_FLIGHT_POLL_INTERVAL', 0.1),
+    }
@@ -22,9 +22,7 @@ export FLASK_DEBUG=0
 # Initialize/Upgrade Database using the venv python
 "$VENV_DIR/bin/python" -m flask db upgrade
 
-# Run with Gunicorn using the venv executable
-# -w 4: 4 worker processes
-# -b 0.0.0.0:5000: Bind to all interfaces on port 5000
-# --access-logfile -: Log access to stdout
-# --error-logfile -: Log errors to stderr
-exec "$VENV_DIR/bin/gunicorn" -w 4 -b 0.0.0.0:5000 --access-logfile - --error-logfile - app:app
\ No newline at end of file
+# Run with Gunicorn using the venv executable; workers, bind address, logging
+# and --preload are set in gunicorn.conf.py (GUNICORN_WORKERS, GUNICORN_BIND,
+# GUNICORN_PRELOAD=0 to disable preloading)
+exec "$VENV_DIR/bin/gunicorn" -c gunicorn.conf.py app:app
\ No newline at end of file
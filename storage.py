@@ -0,0 +1,157 @@
+import os
+from flask import current_app
+from werkzeug.security import safe_join
+
+# Scan media and avatars get unique filenames and are never rewritten
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+
+class LocalStorage:
+    """
+    Stores blobs as files under a root directory (static/ by default, so keys
+    like 'uploads/<name>' keep their existing paths).
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def local_path(self, key):
+        path = safe_join(self.root, key)
+        if path is None:
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def save(self, key, data, content_type=None):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial file
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return key
+
+    def read(self, key):
+        try:
+            with open(self.local_path(key), 'rb') as f:
+                return f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def exists(self, key):
+        try:
+            return os.path.isfile(self.local_path(key))
+        except ValueError:
+            return False
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def url(self, key):
+        # Local files are served by the media blueprint
+        return None
+
+
+class S3Storage:
+    """
+    Stores blobs in an S3-compatible object store (AWS S3, MinIO, R2, ...).
+    Requires boto3 unless a client is passed in.
+    """
+
+    def __init__(self, bucket, prefix='', client=None, endpoint_url=None, region=None,
+                 access_key=None, secret_key=None, url_expires=3600):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.url_expires = url_expires
+        self._client = client
+        self._client_kwargs = {
+            'endpoint_url': endpoint_url,
+            'region_name': region,
+            'aws_access_key_id': access_key,
+            'aws_secret_access_key': secret_key,
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3', **{k: v for k, v in self._client_kwargs.items() if v})
+        return self._client
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def local_path(self, key):
+        return None
+
+    def save(self, key, data, content_type=None):
+        extra = {'CacheControl': IMMUTABLE_CACHE_CONTROL}
+        if content_type:
+            extra['ContentType'] = content_type
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data, **extra)
+        return key
+
+    def read(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            if _is_not_found(e):
+                return None
+            raise
+        return response['Body'].read()
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except Exception as e:
+            if _is_not_found(e):
+                return False
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def url(self, key):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self._key(key)},
+            ExpiresIn=self.url_expires
+        )
+
+
+def _is_not_found(error):
+    response = getattr(error, 'response', None) or {}
+    code = str(response.get('Error', {}).get('Code', ''))
+    return code in ('404', 'NoSuchKey', 'NotFound')
+
+
+def create_storage(app):
+    backend = (app.config.get('STORAGE_BACKEND') or 'local').lower()
+    if backend == 'local':
+        return LocalStorage(app.config.get('STORAGE_LOCAL_ROOT') or os.path.join(app.root_path, 'static'))
+    if backend == 's3':
+        return S3Storage(
+            app.config['S3_BUCKET'],
+            prefix=app.config.get('S3_PREFIX') or '',
+            endpoint_url=app.config.get('S3_ENDPOINT_URL'),
+            region=app.config.get('S3_REGION'),
+            access_key=app.config.get('S3_ACCESS_KEY_ID'),
+            secret_key=app.config.get('S3_SECRET_ACCESS_KEY'),
+            url_expires=app.config.get('S3_URL_EXPIRES', 3600)
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def get_storage(app=None):
+    """
+    Returns the blob storage backend configured for the app (built once per app).
+    """
+    app = app or current_app._get_current_object()
+    storage = app.extensions.get('storage')
+    if storage is None:
+        storage = app.extensions['storage'] = create_storage(app)
+    return storage
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+_executor = None
+_lock = threading.Lock()
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=app.config.get('BACKGROUND_WORKERS', 2),
+                    thread_name_prefix='background'
+                )
+    return _executor
+
+def _run(app, fn, args, kwargs):
+    with app.app_context():
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            app.logger.error(f"Background Task Error ({fn.__name__}): {e}")
+            raise
+
+def submit(app, fn, *args, **kwargs):
+    """
+    Runs fn(*args, **kwargs) on the background pool inside an app context,
+    so slow work (image processing, remote fetches) stays off request threads.
+    Returns the Future.
+    """
+    return _get_executor(app).submit(_run, app, fn, args, kwargs)
+
+def submit_later(app, delay, fn, *args, **kwargs):
+    """
+    Like submit, but hands fn to the background pool only after `delay` seconds,
+    without holding a pool thread while it waits. Returns the timer.
+    """
+    timer = threading.Timer(delay, submit, (app, fn) + args, kwargs)
+    timer.daemon = True
+    timer.start()
+    return timer
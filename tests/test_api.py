@@ -1,13 +1,19 @@
 import pytest
 from app import create_app, db
+from config import Config
 from models import User
 
+class TestConfig(Config):
+    TESTING = True
+    # Must be set before create_app(); the engine is built from it there
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False  # Disable CSRF for testing
+    CACHE_BACKEND = 'null'
+
 @pytest.fixture
-def client():
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+def client(tmp_path):
+    app = create_app(TestConfig)
+    app.config['SCAN_COUNTER_PATH'] = str(tmp_path / 'in_flight.sqlite')
     
     with app.test_client() as client:
         with app.app_context():
@@ -30,3 +36,12 @@ def test_upload_bad_payload(client):
     
     response = client.post('/api/upload', json={})
     assert response.status_code == 400
+
+def test_batch_upload_bad_payload(client):
+    client.post('/login', data={'email': 'test@example.com', 'password': 'password'})
+
+    response = client.post('/api/upload/batch', json={'images': []})
+    assert response.status_code == 400
+
+    response = client.post('/api/upload/batch', json={'images': ['x'] * 100})
+    assert response.status_code == 400
@@ -0,0 +1,45 @@
+import os
+from io import BytesIO
+import pytest
+from flask import Flask
+from PIL import Image
+from media import media
+from avatars import validate_image, store_avatar, generate_thumbnails, thumbnail_filename, avatar_url
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__, root_path=str(tmp_path))
+    app.config['AVATAR_SIZES'] = (64, 128)
+    app.config['CACHE_BACKEND'] = 'null'
+    app.register_blueprint(media)
+    with app.test_request_context():
+        yield app
+
+def _jpeg(size=(800, 600)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+def test_validate_image(app):
+    assert validate_image(_jpeg()) == 'jpg'
+    with pytest.raises(ValueError):
+        validate_image(b'not an image')
+    with pytest.raises(ValueError):
+        validate_image(b'')
+
+def test_thumbnails_and_url(app, tmp_path):
+    filename = store_avatar(_jpeg())
+    user = type('U', (), {'profile_picture': filename})()
+
+    # Original is served until the thumbnails exist
+    assert avatar_url(user, 100).endswith('uploads/' + filename)
+
+    generate_thumbnails(filename)
+    with Image.open(tmp_path / 'static' / 'uploads' / thumbnail_filename(filename, 128)) as thumb:
+        assert thumb.size == (128, 128)
+    assert os.path.exists(tmp_path / 'static' / 'uploads' / thumbnail_filename(filename, 64))
+    assert avatar_url(user, 100).endswith(thumbnail_filename(filename, 128))
+
+def test_default_avatar(app):
+    user = type('U', (), {'profile_picture': 'default_profile.svg'})()
+    assert avatar_url(user).endswith('default_profile.svg')
@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+import pytest
+from flask import Flask
+import batch
+from batch import BatchScan
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    app = Flask(__name__)
+    app.config['OPENAI_API_KEY'] = 'test-key'
+    app.config['SCAN_COUNTER_PATH'] = str(tmp_path / 'in_flight.sqlite')
+    calls = {'analyze': 0}
+    lock = threading.Lock()
+
+    def fake_resolve(client, image_data, usage=None, deadline=None, allow_model=True):
+        return {'a': 'Oat Milk', 'b': 'oat  milk', 'c': 'Crisps'}.get(image_data, 'Unknown'), {'source': 'model'}
+
+    def fake_analyze(client, image_data, user_context, product_name, usage=None, deadline=None, search=True,
+                     label_text=None):
+        if deadline:
+            deadline.timeout()
+        with lock:
+            calls['analyze'] += 1
+        time.sleep(0.2)
+        return json.dumps({'product_name': product_name, 'warnings': [], 'voice_response': None})
+
+    monkeypatch.setattr(batch, 'resolve_product', fake_resolve)
+    monkeypatch.setattr(batch, 'analyze_product', fake_analyze)
+    monkeypatch.setattr(batch, 'synthesize_audio', lambda text, deadline=None: None)
+    monkeypatch.setattr(batch, 'save_temp_image', lambda data, filename: None if data == 'bad' else filename)
+    monkeypatch.setattr(batch, 'start_label_read', lambda image_data: None)
+    app.calls = calls
+    return app
+
+def test_batch_dedupes_same_product(app):
+    with app.app_context():
+        results = list(BatchScan(app, {}, max_workers=4).run(['a', 'b', 'c', 'c']))
+
+    assert sorted(r['index'] for r in results) == [0, 1, 2, 3]
+    # 'a' and 'b' resolve to the same product, the two 'c' uploads are identical
+    assert app.calls['analyze'] == 2
+    assert sum(1 for r in results if r['duplicate']) == 2
+
+def test_batch_runs_items_concurrently(app):
+    with app.app_context():
+        start = time.monotonic()
+        results = list(BatchScan(app, {}, max_workers=4).run(['a', 'c', 'x', 'y']))
+        elapsed = time.monotonic() - start
+
+    assert len(results) == 4
+    assert elapsed < 0.6
+
+def test_batch_items_share_the_request_deadline(app):
+    app.config['SCAN_DEADLINE_SECONDS'] = 0.3
+    with app.app_context():
+        results = list(BatchScan(app, {}, max_workers=1).run(['a', 'c', 'x', 'y']))
+
+    # One worker, 0.2s per analysis: later items start after the batch budget ran out
+    assert len(results) == 4
+    assert any('error' in r for r in results)
+
+def test_batch_fails_items_whose_image_cannot_be_saved(app):
+    with app.app_context():
+        results = sorted(BatchScan(app, {}, max_workers=2).run(['a', 'bad', 'c']), key=lambda r: r['index'])
+
+    assert results[1] == {'error': 'Failed to save image', 'index': 1}
+    assert 'error' not in results[0] and 'error' not in results[2]
+    assert app.calls['analyze'] == 2
@@ -0,0 +1,19 @@
+import subprocess
+import sys
+from commands import parse_importtime
+
+def test_parse_importtime():
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   _io\n"
+        "import time:      2048 |      51200 | openai\n"
+    )
+    assert parse_importtime(output) == [(120, 120, '  _io'), (2048, 51200, 'openai')]
+
+def test_create_app_does_not_import_heavy_sdks():
+    code = (
+        "import sys, app; app.create_app(); "
+        "print(','.join(m for m in ('openai', 'duckduckgo_search', 'PIL', 'authlib', 'alembic') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
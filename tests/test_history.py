@@ -0,0 +1,171 @@
+import threading
+import pytest
+from datetime import datetime, timedelta
+from app import create_app, db
+from config import Config
+from models import User, Scan, ScanStats
+import analysis
+import history
+import tasks
+from history import (record_scan, get_scan_page, decode_cursor, classify_warning, audio_pending,
+                     queue_audio_backfill, AUDIO_UNAVAILABLE)
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    CACHE_BACKEND = 'null'
+
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        u = User(first_name='Test', last_name='User', email='test@example.com')
+        u.set_password('password')
+        db.session.add(u)
+        db.session.commit()
+        yield app
+
+def test_classify_warning():
+    assert classify_warning('Contains peanuts, which you are allergic to') == 'allergy'
+    assert classify_warning('High in added sugar') == 'sugar'
+    assert classify_warning('Tastes bland') == 'other'
+
+def test_record_scan_updates_stats(app):
+    record_scan(1, {'product_name': 'Oat Milk', 'warnings': ['High sugar', 'Contains gluten']}, '{}')
+    record_scan(1, {'product_name': 'Oat Milk', 'warnings': []}, '{}')
+    record_scan(1, {'product_name': 'Crisps', 'warnings': ['High in salt']}, '{}')
+    db.session.commit()
+
+    stats = db.session.get(ScanStats, 1)
+    assert stats.total_scans == 3
+    assert stats.total_warnings == 3
+    assert stats.warnings() == {'sugar': 1, 'allergy': 1, 'sodium': 1}
+    assert stats.top_products(1) == [('Oat Milk', 2)]
+
+def test_concurrent_scans_keep_every_count(tmp_path):
+    class FileConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'app.db')
+
+    app = create_app(FileConfig)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(first_name='Test', last_name='User', email='test@example.com', password_hash='x'))
+        db.session.commit()
+
+    def scans(product_name):
+        for _ in range(5):
+            with app.app_context():
+                record_scan(1, {'product_name': product_name, 'warnings': ['High sugar']}, '{}')
+                db.session.commit()
+
+    # Four tabs scanning at once, starting before the user has a stats row
+    threads = [threading.Thread(target=scans, args=(f'Product {i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        stats = db.session.get(ScanStats, 1)
+        assert stats.total_scans == 20
+        assert stats.total_warnings == 20
+        assert stats.warnings() == {'sugar': 20}
+        assert sorted(count for _, count in stats.top_products()) == [5, 5, 5, 5]
+
+def test_keyset_pagination(app):
+    start = datetime(2025, 1, 1)
+    for i in range(25):
+        # Pairs of scans share a timestamp to exercise the id tie-breaker
+        db.session.add(Scan(user_id=1, created_at=start + timedelta(minutes=i // 2),
+                            product_name=f'Product {i}', warning_count=0))
+    db.session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        scans, next_cursor = get_scan_page(1, cursor, limit=10)
+        seen.extend(scan.id for scan in scans)
+        if not next_cursor:
+            break
+        cursor = decode_cursor(next_cursor)
+
+    assert len(seen) == 25
+    assert len(set(seen)) == 25
+    ordered = [db.session.get(Scan, scan_id) for scan_id in seen]
+    assert ordered == sorted(ordered, key=lambda s: (s.created_at, s.id), reverse=True)
+
+def test_history_api(app):
+    client = app.test_client()
+    client.post('/login', data={'email': 'test@example.com', 'password': 'password'})
+    record_scan(1, {'product_name': 'Oat Milk', 'warnings': []}, '{}')
+    db.session.commit()
+
+    response = client.get('/api/history?limit=5')
+    assert response.status_code == 200
+    assert response.get_json()['scans'][0]['product_name'] == 'Oat Milk'
+    assert response.get_json()['next_cursor'] is None
+
+    assert client.get('/history').status_code == 200
+    assert client.get('/dashboard').status_code == 200
+
+def shed_tts_scan():
+    scan = record_scan(1, {'product_name': 'Oat Milk', 'warnings': [], 'voice_response': 'Fine.'}, '{}',
+                       degraded_stages=['tts'])
+    db.session.commit()
+    return scan
+
+def test_audio_backfill_retries_then_gives_up(app, monkeypatch):
+    attempts = []
+    delays = []
+    def run_now(app, delay, fn, *args):
+        delays.append(delay)
+        return fn(*args)
+    monkeypatch.setattr(analysis, 'synthesize_audio', lambda text, deadline=None: attempts.append(text))
+    monkeypatch.setattr(tasks, 'submit_later', run_now)
+
+    scan = shed_tts_scan()
+    assert audio_pending(scan)
+    queue_audio_backfill(app, scan.id, 'Fine.')
+
+    assert len(attempts) == 3
+    assert delays == [30, 60, 120]
+    assert scan.audio_status == AUDIO_UNAVAILABLE
+    assert not audio_pending(scan)
+
+    client = app.test_client()
+    client.post('/login', data={'email': 'test@example.com', 'password': 'password'})
+    assert b'Audio soon' not in client.get(f'/breakdown?scan_id={scan.id}').data
+
+def test_audio_backfill_attaches_clip(app, monkeypatch):
+    monkeypatch.setattr(analysis, 'synthesize_audio', lambda text, deadline=None: 'clip.mp3')
+    monkeypatch.setattr(tasks, 'submit_later', lambda app, delay, fn, *args: fn(*args))
+
+    scan = shed_tts_scan()
+    queue_audio_backfill(app, scan.id, 'Fine.')
+    assert scan.audio_filename == 'clip.mp3'
+    assert scan.audio_status is None
+
+def test_audio_backfill_queue_is_bounded(app, monkeypatch):
+    scheduled = []
+    # Slots taken here are never released, so restore the count afterwards
+    monkeypatch.setattr(history, '_pending_backfills', 0)
+    monkeypatch.setattr(tasks, 'submit_later', lambda app, delay, fn, *args: scheduled.append(args))
+    app.config['AUDIO_BACKFILL_MAX_PENDING'] = 2
+
+    scans = [shed_tts_scan() for _ in range(3)]
+    for scan in scans:
+        queue_audio_backfill(app, scan.id, 'Fine.')
+
+    assert len(scheduled) == 2
+    assert scans[2].audio_status == AUDIO_UNAVAILABLE
+
+def test_stale_pending_audio_is_not_promised(app):
+    scan = shed_tts_scan()
+    scan.created_at -= timedelta(hours=1)
+    assert not audio_pending(scan)
+
+def test_breakdown_without_a_scan(app):
+    client = app.test_client()
+    client.post('/login', data={'email': 'test@example.com', 'password': 'password'})
+    assert client.get('/breakdown').status_code == 200
@@ -0,0 +1,59 @@
+import json
+import pytest
+from flask import Flask
+import analysis
+from loadtest.run import Pacer, load_images, percentile
+from loadtest.stubs import Faults, Latency, start_in_thread
+
+@pytest.fixture
+def stub_server():
+    server = start_in_thread(port=0)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+@pytest.fixture
+def app(stub_server, tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        OPENAI_API_KEY='stub', OPENAI_BASE_URL=f"{stub_server}/v1",
+        ELEVEN_LABS_API_KEY='stub', ELEVEN_LABS_BASE_URL=stub_server, VOICE_ID='stub',
+        SEARCH_API_URL=f"{stub_server}/search", CACHE_BACKEND='null',
+        PHASH_INDEX_PATH=str(tmp_path / 'phash_index.jsonl')
+    )
+    return app
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 100) == 100
+    assert percentile([], 50) is None
+
+def test_latency_and_fault_specs():
+    assert Latency('fixed:0.25').sample() == 0.25
+    assert 1 <= Latency('uniform:1:2').sample() <= 2
+    assert Latency('lognormal:1:0.5').sample() > 0
+    assert Faults('1:429').status_for_request() == 429
+    assert Faults('0').status_for_request() is None
+
+def test_pacer_stops_at_deadline():
+    pacer = Pacer(rate=1000)
+    assert pacer.wait(stop_at=pacer.next_at + 1)
+    assert not Pacer(rate=1).wait(stop_at=0)
+
+def test_replays_only_saved_scans(tmp_path):
+    for name in ('0c6b5d8b-5193-4d31-9f0a-9a2f7e1b32f3.jpg', '28f3e873b1a54981868c5c28c0a6241d_google.jpg',
+                 '28f3e873b1a54981868c5c28c0a6241d_google_thumb.webp'):
+        (tmp_path / name).write_bytes(b'x')
+    assert len(load_images(str(tmp_path), scans_only=True)) == 1
+    assert len(load_images(str(tmp_path))) == 3
+
+def test_app_talks_to_stubs(app):
+    with app.app_context():
+        analysis_text = analysis.analyze_image_vision('aGVsbG8=', {})
+        result = json.loads(analysis_text)
+        assert result['voice_response']
+        assert analysis.fetch_search_results('oat milk', max_results=3)[0]['title'].startswith('oat milk')
+        assert analysis.generate_audio('hello')
+        client = analysis.get_openai_client('stub', app.config['OPENAI_BASE_URL'])
+        assert len(analysis.identify_products(client, 'aGVsbG8=')) == 3
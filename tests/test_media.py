@@ -0,0 +1,41 @@
+import pytest
+from flask import Flask
+from media import media
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__, root_path=str(tmp_path))
+    app.register_blueprint(media)
+    audio_dir = tmp_path / 'static' / 'audio'
+    audio_dir.mkdir(parents=True)
+    (audio_dir / 'clip.mp3').write_bytes(bytes(range(256)) * 4)
+    return app
+
+def test_range_and_conditional_get(app):
+    client = app.test_client()
+
+    response = client.get('/media/audio/clip.mp3')
+    assert response.status_code == 200
+    assert response.mimetype == 'audio/mpeg'
+    assert 'immutable' in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+
+    response = client.get('/media/audio/clip.mp3', headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+    assert len(response.data) == 100
+
+    response = client.get('/media/audio/clip.mp3', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+def test_accel_redirect(app):
+    app.config['MEDIA_ACCEL_REDIRECT_PREFIX'] = '/protected-media/'
+    response = app.test_client().get('/media/audio/clip.mp3')
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == '/protected-media/audio/clip.mp3'
+    assert response.data == b''
+
+def test_unknown_media(app):
+    client = app.test_client()
+    assert client.get('/media/audio/missing.mp3').status_code == 404
+    assert client.get('/media/secrets/clip.mp3').status_code == 404
+    assert client.get('/media/audio/../audio/clip.mp3').status_code == 404
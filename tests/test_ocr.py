@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+from io import BytesIO
+from types import SimpleNamespace
+from flask import Flask
+from PIL import Image, ImageDraw
+import analysis
+import ocr
+from ocr import label_region, otsu_threshold, preprocess, submit_label_read
+from prompts import build_analysis_messages
+
+def label_photo():
+    # A white label with dark "text" bars on a mid-grey background
+    image = Image.new('L', (800, 600), 128)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([200, 150, 600, 450], fill=245)
+    for y in range(180, 430, 30):
+        draw.rectangle([230, y, 570, y + 12], fill=20)
+    return image
+
+def test_otsu_separates_two_peaks():
+    histogram = [0] * 256
+    histogram[30] = 500
+    histogram[220] = 1500
+    assert 30 <= otsu_threshold(histogram) < 220
+
+def test_label_region_crops_background():
+    cropped = label_region(label_photo())
+    assert cropped.width < 800 and cropped.height < 600
+    assert cropped.width >= 340
+
+def test_preprocess_binarizes():
+    buffer = BytesIO()
+    label_photo().save(buffer, format='PNG')
+    image = preprocess(buffer.getvalue())
+    assert set(image.tobytes()) <= {0, 255}
+    assert min(image.size) >= 1000
+
+def test_label_text_messages_are_text_only():
+    messages = build_analysis_messages('system', 'profile', 'Oat Milk', [], label_text='INGREDIENTS: oats, water')
+    assert messages[0] == {'role': 'system', 'content': 'system'}
+    assert isinstance(messages[1]['content'], str)
+    assert 'INGREDIENTS: oats, water' in messages[1]['content']
+
+def finished_read(result, delay=0.0):
+    # Stands in for an OCR pool future, finishing after `delay` seconds
+    future = Future()
+    threading.Timer(delay, future.set_result, (result,)).start()
+    return future
+
+def test_confident_label_skips_vision(monkeypatch):
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if kwargs['model'] == 'gpt-4o-mini':
+            content = json.dumps({'product_name': 'Oat Milk', 'warnings': [], 'voice_response': 'ok'})
+        else:
+            content = 'Oat Milk'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(analysis, 'get_openai_client', lambda api_key, base_url=None: client)
+    monkeypatch.setattr(analysis, 'fetch_search_results', lambda query, deadline=None: [])
+    label = {'text': 'INGREDIENTS: oats, water, salt, rapeseed oil, calcium, vitamins D and B12',
+             'confidence': 91.0, 'words': 12}
+    monkeypatch.setattr(analysis, 'submit_label_read', lambda image: finished_read(label))
+
+    app = Flask(__name__)
+    app.config.update(OPENAI_API_KEY='test', PHASH_ENABLED=False, CACHE_BACKEND='null')
+    with app.app_context():
+        identity = {}
+        analysis.analyze_image_vision('aGVsbG8=', {}, identity=identity)
+
+    # Identify ran alongside OCR; the analysis is one text-only call to the cheaper model
+    assert [call['model'] for call in calls] == ['gpt-4o', 'gpt-4o-mini']
+    assert isinstance(calls[1]['messages'][1]['content'], str)
+    assert identity['label_read'] is True
+
+def test_ocr_runs_alongside_identify(monkeypatch):
+    def slow_identify(client, image, usage=None, deadline=None, allow_model=True):
+        time.sleep(0.3)
+        return 'Oat Milk', {'source': 'model'}
+
+    monkeypatch.setattr(analysis, 'submit_label_read',
+                        lambda image: finished_read({'text': '', 'confidence': 0.0, 'words': 0}, 0.3))
+    monkeypatch.setattr(analysis, 'resolve_product', slow_identify)
+    monkeypatch.setattr(analysis, 'get_openai_client', lambda api_key, base_url=None: None)
+    monkeypatch.setattr(analysis, 'analyze_product', lambda *args, **kwargs: '{}')
+
+    app = Flask(__name__)
+    app.config.update(OPENAI_API_KEY='test')
+    with app.app_context():
+        start = time.monotonic()
+        analysis.analyze_image_vision('aGVsbG8=', {})
+        assert time.monotonic() - start < 0.5
+
+def test_busy_ocr_workers_are_not_queued_behind(monkeypatch):
+    submitted = []
+
+    class StuckPool:
+        def submit(self, fn, *args):
+            # Never finishes, like a read whose caller timed out
+            submitted.append(args)
+            return Future()
+
+    monkeypatch.setattr(ocr, '_get_pool', lambda app: StuckPool())
+    monkeypatch.setattr(ocr, '_pending', 0)
+    app = Flask(__name__)
+    app.config.update(OCR_WORKERS=2)
+    app.extensions['ocr_available'] = True
+    with app.app_context():
+        reads = [submit_label_read('aGVsbG8=') for _ in range(3)]
+
+    assert reads[0] is not None and reads[1] is not None
+    assert reads[2] is None
+    assert len(submitted) == 2
@@ -0,0 +1,82 @@
+import random
+from io import BytesIO
+from PIL import Image, ImageDraw, ImageEnhance
+from phash import HashIndex, dhash, hamming, informative
+
+def label_image(seed, size=(320, 240)):
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randint(0, size[0]), rng.randint(0, size[1])
+        draw.rectangle([x, y, x + rng.randint(20, 120), y + rng.randint(20, 80)],
+                       fill=(rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+    return image
+
+def to_bytes(image, quality=90):
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+def test_dhash_tolerates_lighting_and_scale():
+    original = label_image(1)
+    variant = ImageEnhance.Brightness(original.resize((640, 480))).enhance(1.15)
+    assert hamming(dhash(to_bytes(original)), dhash(to_bytes(variant, quality=60))) <= 6
+    assert hamming(dhash(to_bytes(original)), dhash(to_bytes(label_image(2)))) > 6
+
+def test_lookup_matches_brute_force():
+    rng = random.Random(0)
+    index = HashIndex(max_distance=7)
+    entries = [rng.getrandbits(64) for _ in range(2000)]
+    for i, value in enumerate(entries):
+        index.add(value, f"product-{i}")
+
+    for i in range(200):
+        value = entries[i]
+        for bit in rng.sample(range(64), rng.randint(0, 9)):
+            value ^= 1 << bit
+        expected = min((hamming(value, e), -n) for n, e in enumerate(entries))
+        match = index.lookup(value)
+        if expected[0] <= 7:
+            assert match == (f"product-{-expected[1]}", expected[0])
+        else:
+            assert match is None
+
+def test_persists_and_picks_up_other_workers(tmp_path):
+    path = str(tmp_path / 'phash_index.jsonl')
+    first = HashIndex(path, refresh_interval=0)
+    second = HashIndex(path, refresh_interval=0)
+    first.add(0xFFFF0000FFFF0000, 'Oat Milk')
+    first.add(0xFFFF0000FFFF0000, 'Oat Milk')
+
+    assert second.lookup(0xFFFF0000FFFF0001) == ('Oat Milk', 1)
+    assert len(HashIndex(path)) == 1
+
+def test_confidence():
+    index = HashIndex(max_distance=6)
+    assert index.confidence(0) == 1.0
+    assert index.confidence(6) == 0.5
+
+def test_low_detail_images_are_not_matched():
+    # A plain white pack and a plain beige one with a small dark mark: different
+    # products, but both hash to a handful of bits within the match threshold
+    plain = Image.new('RGB', (640, 480), (250, 250, 250))
+    marked = Image.new('RGB', (640, 480), (200, 170, 120))
+    ImageDraw.Draw(marked).rectangle([500, 380, 540, 420], fill=(60, 60, 60))
+    plain_hash, marked_hash = dhash(to_bytes(plain)), dhash(to_bytes(marked))
+    assert hamming(plain_hash, marked_hash) <= 6
+    assert not informative(plain_hash) and not informative(marked_hash)
+
+    index = HashIndex()
+    index.add(plain_hash, 'Rice Cakes')
+    assert len(index) == 0
+    assert index.lookup(marked_hash) is None
+
+    assert informative(dhash(to_bytes(label_image(1))))
+
+def test_configured_distance_is_capped(tmp_path):
+    from flask import Flask
+    from phash import create_hash_index
+    app = Flask(__name__)
+    app.config.update(PHASH_MAX_DISTANCE=11, PHASH_INDEX_PATH=str(tmp_path / 'phash_index.jsonl'))
+    assert create_hash_index(app).max_distance == 7
@@ -0,0 +1,110 @@
+import json
+import pytest
+import api
+from app import create_app, db
+from config import Config
+from models import User
+from planner import LoadMonitor, ScanCounter, monitor, plan_scan, timed
+from resilience import CircuitOpenError, get_breaker
+
+CONFIG = {'SCAN_LATENCY_SLO_SECONDS': 20, 'SCAN_CONCURRENCY': 4}
+
+def monitor_with(latencies, in_flight=1):
+    load_monitor = LoadMonitor()
+    for stage, seconds in latencies.items():
+        load_monitor.observe(stage, seconds)
+    load_monitor.in_flight = in_flight
+    return load_monitor
+
+def test_full_plan_when_fast():
+    plan = plan_scan(CONFIG, monitor_with({'identify': 1, 'search': 1, 'analyze': 5, 'tts': 1}))
+    assert not plan.degraded
+    assert plan.identify and plan.search and plan.tts
+
+def test_sheds_tts_first_when_slow():
+    plan = plan_scan(CONFIG, monitor_with({'identify': 2, 'search': 2, 'analyze': 14, 'tts': 4}))
+    assert plan.skipped == ['tts']
+    assert plan.estimate <= 20
+
+def test_sheds_everything_optional_under_heavy_load():
+    plan = plan_scan(CONFIG, monitor_with({'identify': 2, 'search': 2, 'analyze': 6, 'tts': 2}, in_flight=16))
+    assert plan.skipped == ['tts', 'search', 'identify']
+
+def test_skips_stage_with_open_circuit():
+    breaker = get_breaker('elevenlabs')
+    try:
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        plan = plan_scan(CONFIG, monitor_with({'analyze': 5}))
+        assert plan.skipped == ['tts']
+    finally:
+        breaker.record_success()
+
+def test_disabled():
+    plan = plan_scan(dict(CONFIG, DEGRADE_ENABLED=False), monitor_with({'analyze': 60}, in_flight=50))
+    assert not plan.degraded
+
+def test_latency_is_smoothed():
+    load_monitor = LoadMonitor(alpha=0.5)
+    load_monitor.observe('analyze', 10)
+    load_monitor.observe('analyze', 20)
+    assert load_monitor.latency('analyze') == 15
+    with load_monitor.track():
+        assert load_monitor.in_flight == 1
+    assert load_monitor.in_flight == 0
+
+def test_open_circuit_is_not_timed(monkeypatch):
+    monkeypatch.setattr(monitor, 'latencies', {'search': 3})
+    with pytest.raises(CircuitOpenError):
+        with timed('search'):
+            raise CircuitOpenError('search')
+    assert monitor.latency('search') == 3
+
+def test_counter_is_shared_between_workers(tmp_path):
+    # Two monitors on one file stand in for two gunicorn worker processes
+    path = str(tmp_path / 'in_flight.sqlite')
+    worker_a, counter_a = LoadMonitor(), ScanCounter(path)
+    worker_b, counter_b = LoadMonitor(), ScanCounter(path)
+    with worker_a.track(counter_a), worker_a.track(counter_a):
+        assert worker_b.node_in_flight(counter_b) == 2
+        assert worker_b.in_flight == 0
+    assert worker_b.node_in_flight(counter_b) == 0
+
+def test_counter_drops_expired_scans(tmp_path):
+    counter = ScanCounter(str(tmp_path / 'in_flight.sqlite'), ttl=-1)
+    counter.acquire()
+    assert counter.count() == 0
+
+def test_upload_sheds_when_other_workers_are_busy(tmp_path, monkeypatch):
+    class NodeConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        CACHE_BACKEND = 'null'
+        SCAN_COUNTER_PATH = str(tmp_path / 'in_flight.sqlite')
+
+    monkeypatch.setattr(monitor, 'latencies', {'identify': 2, 'search': 2, 'analyze': 6, 'tts': 2})
+    monkeypatch.setattr(api, 'save_temp_image', lambda data, filename: filename)
+    monkeypatch.setattr(api, 'queue_audio_backfill', lambda *args: None)
+    monkeypatch.setattr(api, 'analyze_image_vision', lambda *args: json.dumps(
+        {'product_name': 'Oat Milk', 'warnings': [], 'voice_response': None}))
+
+    app = create_app(NodeConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(first_name='Test', last_name='User', email='test@example.com')
+        user.set_password('password')
+        db.session.add(user)
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/login', data={'email': 'test@example.com', 'password': 'password'})
+    assert client.post('/api/upload', json={'image_data': 'x'}).get_json()['degraded'] == []
+
+    # Sixteen scans running in the node's other worker processes
+    others = ScanCounter(NodeConfig.SCAN_COUNTER_PATH)
+    tokens = [others.acquire() for _ in range(16)]
+    assert client.post('/api/upload', json={'image_data': 'x'}).get_json()['degraded'] == ['tts', 'search', 'identify']
+
+    for token in tokens:
+        others.release(token)
+    assert client.post('/api/upload', json={'image_data': 'x'}).get_json()['degraded'] == []
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+from prompts import ANALYSIS_INSTRUCTIONS, TokenUsage, build_analysis_messages, build_system_prompt, trim_snippets
+
+def test_trim_snippets_dedupes_and_respects_budget():
+    results = [
+        {'title': 'Brand site', 'body': 'Oats, water, rapeseed oil, salt.'},
+        {'title': 'Mirror', 'body': 'Oats, water,  rapeseed oil, salt.'},
+        {'title': 'Long page', 'body': 'word ' * 500},
+        {'title': 'Other', 'body': 'Contains 4g of sugar per 100ml.'},
+    ]
+    snippets = trim_snippets(results, token_budget=200)
+    assert len(snippets) == 3
+    assert snippets[0].startswith('- Brand site:')
+    assert all(len(s) < 400 for s in snippets)
+
+    assert len(trim_snippets(results, token_budget=15)) == 1
+
+def test_static_prefix_comes_first():
+    system_prompt = build_system_prompt('You are a nutritionist.')
+    assert system_prompt.endswith(ANALYSIS_INSTRUCTIONS)
+
+    messages = build_analysis_messages(system_prompt, 'User Profile:\nAllergies: Peanuts',
+                                       'Oat Milk', ['- a: b'], 'data:image/jpeg;base64,xx')
+    assert messages[0] == {'role': 'system', 'content': system_prompt}
+    text = messages[1]['content'][0]['text']
+    assert 'Peanuts' in text and 'Oat Milk' in text
+    assert messages[1]['content'][1]['type'] == 'image_url'
+
+def test_token_usage():
+    response = SimpleNamespace(usage=SimpleNamespace(
+        prompt_tokens=1200, completion_tokens=150,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=1024)))
+    usage = TokenUsage()
+    usage.add('analyze', response)
+    usage.add('identify', SimpleNamespace(usage=None))
+    assert usage.as_dict() == {'prompt_tokens': 1200, 'cached_tokens': 1024, 'completion_tokens': 150}
@@ -0,0 +1,93 @@
+import time
+import pytest
+from resilience import (
+    CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, UpstreamHTTPError,
+    call_with_retries, hedged_call, is_retryable
+)
+
+class Timeout(Exception):
+    """Named like requests.Timeout so it is treated as transient."""
+
+def flaky(failures, error=Timeout):
+    calls = []
+    def fn(timeout):
+        calls.append(timeout)
+        if len(calls) <= failures:
+            raise error()
+        return 'ok'
+    return fn, calls
+
+def test_retries_transient_errors_then_succeeds():
+    fn, calls = flaky(2)
+    breaker = CircuitBreaker('test')
+    sleeps = []
+    assert call_with_retries(fn, breaker, retries=2, stage_cap=5, sleep=sleeps.append) == 'ok'
+    assert calls == [5, 5, 5]
+    assert len(sleeps) == 2
+    assert breaker.failures == 0
+
+def test_does_not_retry_client_errors():
+    fn, calls = flaky(1, lambda: UpstreamHTTPError('OpenAI', 400))
+    with pytest.raises(UpstreamHTTPError):
+        call_with_retries(fn, CircuitBreaker('test'), retries=2, sleep=lambda s: None)
+    assert len(calls) == 1
+
+def test_is_retryable():
+    assert is_retryable(UpstreamHTTPError('ElevenLabs', 503))
+    assert is_retryable(UpstreamHTTPError('ElevenLabs', 429))
+    assert not is_retryable(UpstreamHTTPError('ElevenLabs', 401))
+    assert is_retryable(Timeout())
+    assert not is_retryable(ValueError())
+
+def test_circuit_opens_and_half_opens():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.05)
+    fn, calls = flaky(10)
+    for _ in range(2):
+        with pytest.raises(Timeout):
+            call_with_retries(fn, breaker, retries=0)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        call_with_retries(fn, breaker, retries=0)
+    assert len(calls) == 2
+
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert call_with_retries(lambda timeout: 'ok', breaker) == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_deadline_caps_stage_timeout():
+    deadline = Deadline(10)
+    assert deadline.timeout(4) == 4
+    assert 9 < deadline.timeout() <= 10
+
+    expired = Deadline(0)
+    with pytest.raises(DeadlineExceeded):
+        expired.timeout(4)
+    with pytest.raises(DeadlineExceeded):
+        call_with_retries(lambda timeout: 'ok', CircuitBreaker('test'), deadline=expired)
+
+def test_hedged_call_returns_faster_duplicate():
+    calls = []
+    def fn():
+        calls.append(1)
+        # The first call stalls; the hedge answers straight away
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return 'slow'
+        return 'fast'
+    assert hedged_call(fn, hedge_delay=0.05, timeout=2) == 'fast'
+    assert len(calls) == 2
+
+def test_hedged_call_times_out():
+    with pytest.raises(DeadlineExceeded):
+        hedged_call(lambda: time.sleep(0.3), hedge_delay=0.05, timeout=0.1)
+
+def test_scan_deadline_fits_server_timeout():
+    from config import scan_deadline
+    assert scan_deadline(60, 10) == 50
+    assert scan_deadline(60, 10, configured=90) == 50
+    assert scan_deadline(60, 10, configured=20) == 20
+    # gunicorn's timeout=0 disables it: no cap, and never a negative budget
+    assert scan_deadline(0, 10) == 45
+    assert scan_deadline(0, 10, configured=90) == 90
+    assert scan_deadline(5, 10) == 1
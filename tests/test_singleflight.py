@@ -0,0 +1,88 @@
+import threading
+import time
+import pytest
+from flask import Flask
+from cache import SQLiteCache
+from singleflight import SingleFlight, coalesce
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def cache(tmp_path):
+    return SQLiteCache(str(tmp_path / 'cache.sqlite'))
+
+def run_concurrently(fn, count=8):
+    results = [None] * count
+    def worker(i):
+        results[i] = fn()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def slow_compute(calls, value='result'):
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return value
+    return compute
+
+def test_single_flight_shares_one_call():
+    calls = []
+    group = SingleFlight()
+    results = run_concurrently(lambda: group.do('key', slow_compute(calls)))
+    assert results == ['result'] * 8
+    assert len(calls) == 1
+
+def test_single_flight_shares_exceptions():
+    group = SingleFlight()
+    def fail():
+        time.sleep(0.1)
+        raise ValueError('upstream down')
+    errors = []
+    def call():
+        try:
+            group.do('key', fail)
+        except ValueError as e:
+            errors.append(e)
+    run_concurrently(call, 4)
+    assert len(errors) == 4
+
+def test_single_flight_runs_itself_after_timeout():
+    group = SingleFlight()
+    leader = threading.Thread(target=group.do, args=('key', lambda: time.sleep(0.5)))
+    leader.start()
+    time.sleep(0.05)
+    assert group.do('key', lambda: 'own', timeout=0.05) == 'own'
+    leader.join()
+
+def test_coalesce_caches_result(app, cache):
+    calls = []
+    results = run_concurrently(lambda: coalesce('search:abc', slow_compute(calls), cache, ttl=60))
+    assert results == ['result'] * 8
+    assert coalesce('search:abc', slow_compute(calls), cache) == 'result'
+    assert len(calls) == 1
+    assert cache.get('lease:search:abc') is None
+
+def test_waits_for_lease_held_by_another_process(app, cache):
+    cache.add('lease:tts:abc', 1234, 30)
+    def other_worker():
+        time.sleep(0.2)
+        cache.set('tts:abc', 'clip.mp3', 60)
+    threading.Thread(target=other_worker).start()
+
+    calls = []
+    assert coalesce('tts:abc', slow_compute(calls), cache, poll_interval=0.05) == 'clip.mp3'
+    assert calls == []
+
+def test_computes_when_lease_holder_gives_up(app, cache):
+    cache.add('lease:tts:abc', 1234, 0.2)
+    calls = []
+    assert coalesce('tts:abc', slow_compute(calls), cache, poll_interval=0.05) == 'result'
+    assert len(calls) == 1
@@ -0,0 +1,115 @@
+import io
+import pytest
+from storage import LocalStorage, S3Storage
+from cache import SQLiteCache, RedisCache, cache_key
+
+class FakeS3Error(Exception):
+    def __init__(self, code):
+        self.response = {'Error': {'Code': code}}
+
+class FakeS3Client:
+    """In-memory stand-in for the subset of the boto3 S3 client we use."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **extra):
+        self.objects[(Bucket, Key)] = (Body, extra)
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error('NoSuchKey')
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)][0])}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error('404')
+        return {}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.local/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode('utf-8')
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+def _exercise_storage(storage):
+    assert storage.read('audio/a.mp3') is None
+    assert not storage.exists('audio/a.mp3')
+    storage.save('audio/a.mp3', b'abc', 'audio/mpeg')
+    assert storage.exists('audio/a.mp3')
+    assert storage.read('audio/a.mp3') == b'abc'
+    storage.delete('audio/a.mp3')
+    assert not storage.exists('audio/a.mp3')
+
+def test_local_storage(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    _exercise_storage(storage)
+    with pytest.raises(ValueError):
+        storage.local_path('../outside.txt')
+
+def test_s3_storage():
+    client = FakeS3Client()
+    storage = S3Storage('scans', prefix='prod', client=client)
+    _exercise_storage(storage)
+    storage.save('uploads/x.jpg', b'img', 'image/jpeg')
+    assert ('scans', 'prod/uploads/x.jpg') in client.objects
+    assert storage.local_path('uploads/x.jpg') is None
+    assert storage.url('uploads/x.jpg').startswith('https://s3.local/scans/prod/uploads/x.jpg')
+
+@pytest.mark.parametrize('make_cache', [
+    lambda tmp_path: SQLiteCache(str(tmp_path / 'cache.sqlite')),
+    lambda tmp_path: RedisCache(client=FakeRedis()),
+])
+def test_cache_backends(tmp_path, make_cache):
+    cache = make_cache(tmp_path)
+    key = cache_key('search', 'oat milk')
+    assert cache.get(key) is None
+    cache.set(key, [{'title': 't', 'body': 'b'}], ttl=60)
+    assert cache.get(key) == [{'title': 't', 'body': 'b'}]
+    assert not cache.add(key, 'other')
+    cache.delete(key)
+    assert cache.add(key, 'first')
+    assert cache.get(key) == 'first'
+
+def test_sqlite_cache_expiry(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'))
+    cache.set('k', 1, ttl=-1)
+    assert cache.get('k') is None
+    assert cache.add('k', 2, ttl=60)
+
+def test_cached_audio_missing_from_storage_is_regenerated(tmp_path, monkeypatch):
+    import analysis
+    from flask import Flask
+    app = Flask(__name__)
+    app.config.update(STORAGE_LOCAL_ROOT=str(tmp_path / 'static'), CACHE_SQLITE_PATH=str(tmp_path / 'cache.sqlite'),
+                      VOICE_ID='voice')
+    generated = []
+    monkeypatch.setattr(analysis, 'generate_audio', lambda text, deadline=None: generated.append(text) or 'aGk=')
+
+    with app.app_context():
+        first = analysis.synthesize_audio('Fine in moderation.')
+        assert analysis.synthesize_audio('Fine in moderation.') == first
+        assert len(generated) == 1
+
+        # As seen from another node sharing the cache but not the disk
+        analysis.get_storage().delete(f"audio/{first}")
+        second = analysis.synthesize_audio('Fine in moderation.')
+        assert second != first
+        assert analysis.get_storage().exists(f"audio/{second}")
+        assert len(generated) == 2